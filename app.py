@@ -2,32 +2,74 @@
 # app.py — Flask Web App for Movie Search
 # =====================================
 
-from flask import Flask, jsonify, request, send_from_directory, session
+import startup  # first: times everything below
+from flask import Flask, Response, g, jsonify, request, send_from_directory, session, stream_with_context
 from flask_cors import CORS
-from process import smart_search, combined_df
+startup.checkpoint("import_flask")
+from process import combined_df, movie_id_index, materialize_movies, sort_rows, content_batcher, MOVIE_COLUMNS, search_stages, engine_memory
+from db import get_db, release_db
+import search_executor
+from shards import sharded_search
+from recommend import recommend_for_user, invalidate_profile, CoSaveIndex, profile_cache_memory
+from memstats import process_memory
+import telemetry
+import slowlog
+import profiling
 import pandas as pd
+import numpy as np
 import os
-import sqlite3
+import json
+import time
+import zlib
 import hashlib
 from functools import wraps
 from datetime import datetime, timedelta
+startup.checkpoint("import_app_modules")
 
 # Configure Flask to serve React build files
 app = Flask(__name__, static_folder='frontend/dist', static_url_path='')
 app.secret_key = 'dev-secret-key-change-in-production'  # WARNING: Change in production!
 CORS(app, supports_credentials=True, origins=['http://localhost:5173', 'http://127.0.0.1:8000'])  # Enable CORS with credentials
+app.teardown_request(release_db)  # Roll back anything a failed request left uncommitted
 
-DB_PATH = "checkpoints/movies.db"
+# Endpoints whose slow requests go to the slow-query log (see slowlog.py)
+SLOW_LOG_ENDPOINTS = {'/api/search', '/api/movie/<movie_id>'}
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.stage_timings = telemetry.begin_trace()
+    mode = profiling.requested_mode(request.headers)
+    if mode:
+        g.profile = profiling.start(mode)
+
+@app.after_request
+def record_request_metrics(response):
+    """Per-endpoint latency histogram and status counter (streamed bodies: time to first byte)"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        telemetry.observe("http_request_seconds", elapsed, endpoint=endpoint)
+        telemetry.inc("http_requests_total", endpoint=endpoint, status=response.status_code)
+        if endpoint in SLOW_LOG_ENDPOINTS:
+            slowlog.record(endpoint, elapsed, telemetry.end_trace(g.stage_timings),
+                           status=response.status_code, **g.get('slow_log_fields', {}))
+    if 'profile' in g:
+        path = profiling.stop(g.pop('profile'), request.path)
+        response.headers['X-Profile-Output'] = os.path.basename(path)
+    return response
+
+@app.teardown_request
+def end_request_trace(exc=None):
+    if 'stage_timings' in g:
+        telemetry.end_trace(g.pop('stage_timings'))
+    if 'profile' in g:  # the view raised before after_request could stop it
+        profiling.stop(g.pop('profile'), request.path)
 
 # =====================================
 # Helper functions
 # =====================================
-def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
 def hash_password(password):
     """Hash password (NOT secure for production!)"""
     return hashlib.sha256(password.encode()).hexdigest()
@@ -41,10 +83,91 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def clean_movie_data(movies):
+def init_db():
+    """Create the user tables if missing and the indexes the hot queries rely on"""
+    conn = get_db()
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            avatar_url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS favorites (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            movie_id TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'watch_later',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, movie_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_favorites_user_status_updated
+            ON favorites(user_id, status, updated_at);
+        CREATE INDEX IF NOT EXISTS idx_favorites_user_updated
+            ON favorites(user_id, updated_at);
+        CREATE INDEX IF NOT EXISTS idx_movies_id ON movies(id);
+    """)
+    conn.commit()
+
+init_db()
+
+def load_favorite_pairs():
+    """Load every (user_id, movie_id) pair for the co-occurrence index rebuild"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("SELECT user_id, movie_id FROM favorites")
+    pairs = [tuple(row) for row in cursor.fetchall()]
+    return pairs
+
+cosave_index = CoSaveIndex(load_favorite_pairs)
+# Built once here (in the gunicorn master with preload, shared by the workers);
+# each process then refreshes it from a background thread, never on a request
+cosave_index.rebuild()
+startup.checkpoint("app_init")
+
+# Named `fields=` presets; "detail" is every stored column (the default)
+FIELD_PRESETS = {
+    "card": ["id", "title", "year", "poster_url", "rating", "genre", "runtime"],
+    "detail": MOVIE_COLUMNS,
+}
+
+# Upper bound on ids per /api/movies bulk lookup
+MAX_BULK_IDS = int(os.environ.get("MAX_BULK_IDS", 500))
+
+def requested_fields():
+    """Parse `?fields=` into (columns, error): a preset name or comma-separated
+    column names; None means every column. `id` is always included."""
+    spec = request.args.get('fields', '').strip()
+    if not spec:
+        return None, None
+    if spec in FIELD_PRESETS:
+        return FIELD_PRESETS[spec], None
+    
+    fields = [f.strip() for f in spec.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in MOVIE_COLUMNS]
+    if unknown:
+        return None, f"Unknown field(s): {', '.join(unknown)}"
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields, None
+
+def clean_movie_data(movies, fields=None):
     """Convert NaN and numpy types to JSON-serializable format"""
+    with telemetry.stage("serialize"):
+        return _clean_movie_data(movies, fields)
+
+def _clean_movie_data(movies, fields):
     if isinstance(movies, pd.DataFrame):
-        movies = movies.to_dict(orient='records')
+        # Slices of the serving store: build the requested columns, keeping any extra score columns
+        extra_cols = [c for c in movies.columns if c not in combined_df.columns]
+        records = materialize_movies(movies.index, fields)
+        if extra_cols:
+            for record, extra in zip(records, movies[extra_cols].to_dict(orient='records')):
+                record.update(extra)
+        movies = records
     
     for movie in movies:
         for key, value in movie.items():
@@ -79,7 +202,6 @@ def register():
         # Check if username or email already exists
         cursor.execute("SELECT id FROM users WHERE username = ? OR email = ?", (username, email))
         if cursor.fetchone():
-            conn.close()
             return jsonify({"success": False, "error": "Username or email already exists"}), 400
         
         # Insert new user
@@ -94,7 +216,6 @@ def register():
         # Get user data
         cursor.execute("SELECT id, username, email, avatar_url, created_at FROM users WHERE id = ?", (user_id,))
         user = dict(cursor.fetchone())
-        conn.close()
         
         # Set session
         session['user_id'] = user['id']
@@ -128,7 +249,6 @@ def login():
             (username, username, password_hash)
         )
         user = cursor.fetchone()
-        conn.close()
         
         if not user:
             return jsonify({"success": False, "error": "Invalid username or password"}), 401
@@ -166,7 +286,6 @@ def get_current_user():
             (session['user_id'],)
         )
         user = cursor.fetchone()
-        conn.close()
         
         if not user:
             session.clear()
@@ -186,40 +305,54 @@ def get_current_user():
 @app.route('/api/favorites', methods=['GET'])
 @login_required
 def get_favorites():
-    """Get user's favorite movies"""
+    """Get user's favorite movies (keyset-paginated when `limit` is given)"""
     try:
+        fields, fields_error = requested_fields()
+        if fields_error:
+            return jsonify({"success": False, "error": fields_error}), 400
         status = request.args.get('status')  # Optional filter by status
+        limit = request.args.get('limit', type=int)
+        cursor_arg = request.args.get('cursor')  # "<updated_at>|<favorite id>" from next_cursor
+        
+        sql = "SELECT id, movie_id, status, created_at, updated_at FROM favorites WHERE user_id = ?"
+        params = [session['user_id']]
+        if status:
+            sql += " AND status = ?"
+            params.append(status)
+        if cursor_arg:
+            try:
+                cursor_updated_at, cursor_id = cursor_arg.rsplit('|', 1)
+                params.extend([cursor_updated_at, int(cursor_id)])
+            except ValueError:
+                return jsonify({"success": False, "error": "Invalid cursor"}), 400
+            sql += " AND (updated_at, id) < (?, ?)"
+        sql += " ORDER BY updated_at DESC, id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
         
         conn = get_db()
         cursor = conn.cursor()
+        cursor.execute(sql, params)
+        favorites = [dict(row) for row in cursor.fetchall()]
         
-        if status:
-            cursor.execute(
-                "SELECT movie_id, status, created_at, updated_at FROM favorites WHERE user_id = ? AND status = ? ORDER BY updated_at DESC",
-                (session['user_id'], status)
-            )
-        else:
-            cursor.execute(
-                "SELECT movie_id, status, created_at, updated_at FROM favorites WHERE user_id = ? ORDER BY updated_at DESC",
-                (session['user_id'],)
-            )
+        # Resolve all movie rows in one id-index lookup
+        rows = movie_id_index.get_indexer([fav['movie_id'] for fav in favorites])
+        found = rows >= 0
+        movie_list = materialize_movies(rows[found], fields)
+        for movie_dict, fav in zip(movie_list, (fav for fav, ok in zip(favorites, found) if ok)):
+            movie_dict['favorite_status'] = fav['status']
+            movie_dict['favorited_at'] = fav['created_at']
         
-        favorites = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        # Get movie details for each favorite
-        movie_list = []
-        for fav in favorites:
-            movie = combined_df[combined_df["id"] == fav['movie_id']]
-            if not movie.empty:
-                movie_dict = movie.iloc[0].to_dict()
-                movie_dict['favorite_status'] = fav['status']
-                movie_dict['favorited_at'] = fav['created_at']
-                movie_list.append(movie_dict)
+        next_cursor = None
+        if limit and len(favorites) == limit:
+            last = favorites[-1]
+            next_cursor = f"{last['updated_at']}|{last['id']}"
         
         return jsonify({
             "success": True,
-            "data": clean_movie_data(movie_list)
+            "data": clean_movie_data(movie_list),
+            "next_cursor": next_cursor
         })
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -257,9 +390,18 @@ def add_favorite(movie_id):
                 "INSERT INTO favorites (user_id, movie_id, status) VALUES (?, ?, ?)",
                 (session['user_id'], movie_id, status)
             )
+            cursor.execute(
+                "SELECT movie_id FROM favorites WHERE user_id = ? AND movie_id != ?",
+                (session['user_id'], movie_id)
+            )
+            other_movie_ids = [row['movie_id'] for row in cursor.fetchall()]
         
-        conn.commit()
-        conn.close()
+        # Commit and record together so a concurrent index rebuild sees the change exactly once
+        with cosave_index.commit_lock:
+            conn.commit()
+            if not existing:
+                cosave_index.record_add(movie_id, other_movie_ids)
+        invalidate_profile(session['user_id'])
         
         return jsonify({
             "success": True,
@@ -279,8 +421,17 @@ def remove_favorite(movie_id):
             "DELETE FROM favorites WHERE user_id = ? AND movie_id = ?",
             (session['user_id'], movie_id)
         )
-        conn.commit()
-        conn.close()
+        removed = cursor.rowcount > 0
+        cursor.execute(
+            "SELECT movie_id FROM favorites WHERE user_id = ?",
+            (session['user_id'],)
+        )
+        other_movie_ids = [row['movie_id'] for row in cursor.fetchall()]
+        with cosave_index.commit_lock:
+            conn.commit()
+            if removed:
+                cosave_index.record_remove(movie_id, other_movie_ids)
+        invalidate_profile(session['user_id'])
         
         return jsonify({"success": True})
     except Exception as e:
@@ -298,7 +449,6 @@ def get_favorite_status(movie_id):
             (session['user_id'], movie_id)
         )
         result = cursor.fetchone()
-        conn.close()
         
         return jsonify({
             "success": True,
@@ -307,6 +457,63 @@ def get_favorite_status(movie_id):
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+# =====================================
+# Recommendation Routes
+# =====================================
+
+@app.route('/api/recommendations')
+@login_required
+def get_recommendations():
+    """Recommend unseen movies from the user's completed/watching favorites"""
+    try:
+        fields, fields_error = requested_fields()
+        if fields_error:
+            return jsonify({"success": False, "error": fields_error}), 400
+        limit = request.args.get('limit', 20, type=int)
+        user_id = session['user_id']
+
+        def load_favorites():
+            conn = get_db()
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT movie_id, status, updated_at FROM favorites WHERE user_id = ?",
+                (user_id,)
+            )
+            favorites = [dict(row) for row in cursor.fetchall()]
+            return favorites
+
+        rows, scores = recommend_for_user(user_id, load_favorites, top_n=limit)
+        movies = materialize_movies(rows, fields)
+        for movie, score in zip(movies, scores):
+            movie['recommendation_score'] = float(score)
+
+        return jsonify({
+            "success": True,
+            "data": clean_movie_data(movies)
+        })
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/movie/<movie_id>/also-saved')
+def get_also_saved(movie_id):
+    """Get movies most often saved together with this one"""
+    try:
+        fields, fields_error = requested_fields()
+        if fields_error:
+            return jsonify({"success": False, "error": fields_error}), 400
+        limit = request.args.get('limit', 12, type=int)
+        rows, counts = cosave_index.top_k(movie_id, k=limit)
+        movies = materialize_movies(rows, fields)
+        for movie, count in zip(movies, counts):
+            movie['co_saved_count'] = int(count)
+
+        return jsonify({
+            "success": True,
+            "data": clean_movie_data(movies)
+        })
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
 # =====================================
 # Movie API Routes
 # =====================================
@@ -320,6 +527,9 @@ def health():
 def get_top_rated():
     """Get top rated movies - curated list"""
     try:
+        fields, fields_error = requested_fields()
+        if fields_error:
+            return jsonify({"success": False, "error": fields_error}), 400
         top_rated_ids = [
             'tt1375666',  # Inception
             'tt0137523',  # Fight Club
@@ -344,11 +554,8 @@ def get_top_rated():
         ]
         
         # Get movies in the specified order
-        movies = []
-        for movie_id in top_rated_ids:
-            movie_row = combined_df[combined_df["id"] == movie_id]
-            if not movie_row.empty:
-                movies.append(movie_row.iloc[0].to_dict())
+        rows = movie_id_index.get_indexer(top_rated_ids)
+        movies = materialize_movies(rows[rows >= 0], fields)
         
         return jsonify({
             "success": True,
@@ -357,27 +564,57 @@ def get_top_rated():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/movies', methods=['GET', 'POST'])
+def get_movies_by_ids():
+    """Bulk lookup: movies for `ids` in request order (GET ?ids=a,b or POST {"ids": [...]})"""
+    try:
+        fields, fields_error = requested_fields()
+        if fields_error:
+            return jsonify({"success": False, "error": fields_error}), 400
+        
+        if request.method == 'POST':
+            ids = (request.get_json(silent=True) or {}).get('ids', [])
+        else:
+            ids = [i.strip() for i in request.args.get('ids', '').split(',') if i.strip()]
+        if not isinstance(ids, list):
+            return jsonify({"success": False, "error": "ids must be a list"}), 400
+        if len(ids) > MAX_BULK_IDS:
+            return jsonify({"success": False, "error": f"At most {MAX_BULK_IDS} ids per request"}), 400
+        
+        # One pass through the id index; unknown ids come back as -1
+        rows = movie_id_index.get_indexer([str(i) for i in ids])
+        found = rows >= 0
+        movies = materialize_movies(rows[found], fields)
+        
+        return jsonify({
+            "success": True,
+            "data": clean_movie_data(movies),
+            "missing": [i for i, ok in zip(ids, found) if not ok]
+        })
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @app.route('/api/movies/genre/<genre>')
 def get_movies_by_genre(genre):
     """Get movies by genre"""
     try:
+        fields, fields_error = requested_fields()
+        if fields_error:
+            return jsonify({"success": False, "error": fields_error}), 400
         limit = request.args.get('limit', 20, type=int)
         
         if "genre" not in combined_df.columns:
             return jsonify({"success": False, "error": "Genre column not found"}), 400
             
-        genre_df = combined_df[combined_df["genre"].apply(lambda x: genre.lower() in str(x).lower())]
-        sort_cols = [c for c in ["rating", "vote_count"] if c in genre_df.columns]
-        
-        if sort_cols:
-            genre_df = genre_df.sort_values(by=sort_cols, ascending=False)
-        
-        movies = genre_df.head(limit)
+        # Row positions only: the page is the one thing that gets materialized
+        mask = combined_df["genre"].apply(lambda x: genre.lower() in str(x).lower())
+        rows = np.flatnonzero(mask.to_numpy(dtype=bool, na_value=False))
+        rows = sort_rows(rows, ["rating", "vote_count"], combined_df)
         
         return jsonify({
             "success": True,
-            "data": clean_movie_data(movies),
-            "total": len(genre_df)
+            "data": clean_movie_data(materialize_movies(rows[:limit], fields)),
+            "total": len(rows)
         })
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -386,6 +623,9 @@ def get_movies_by_genre(genre):
 def get_all_genres():
     """Get curated movies for each genre"""
     try:
+        fields, fields_error = requested_fields()
+        if fields_error:
+            return jsonify({"success": False, "error": fields_error}), 400
         # Curated genre lists with well-known movies (balanced rating + popularity)
         genre_ids = {
             "Action": [
@@ -547,12 +787,8 @@ def get_all_genres():
         
         genre_data = {}
         for genre, movie_ids in genre_ids.items():
-            movies = []
-            for movie_id in movie_ids[:20]:  # Take first 20
-                movie_row = combined_df[combined_df["id"] == movie_id]
-                if not movie_row.empty:
-                    movies.append(movie_row.iloc[0].to_dict())
-            genre_data[genre] = clean_movie_data(movies)
+            rows = movie_id_index.get_indexer(movie_ids[:20])  # Take first 20
+            genre_data[genre] = clean_movie_data(materialize_movies(rows[rows >= 0], fields))
         
         return jsonify({
             "success": True,
@@ -568,6 +804,9 @@ def search():
         query = request.args.get("query", "").strip()
         page = request.args.get("page", 1, type=int)
         per_page = request.args.get("per_page", 36, type=int)
+        fields, fields_error = requested_fields()
+        if fields_error:
+            return jsonify({"success": False, "error": fields_error}), 400
         
         if not query:
             return jsonify({
@@ -579,52 +818,100 @@ def search():
                 "total_results": 0
             })
         
-        # Perform smart search
-        results = smart_search(query, df=combined_df, top_n=1000)
+        explain = request.args.get('explain', '0') in ('1', 'true')
+        
+        # Perform smart search (with explain, the plan comes from the engine that served it)
+        results = search_executor.search(query, top_n=1000, explain=explain)
         
         if results is None or results.empty:
-            return jsonify({
+            response = {
                 "success": True,
                 "data": [],
                 "query": query,
                 "page": 1,
                 "total_pages": 1,
                 "total_results": 0
-            })
+            }
+            if explain and results is not None:
+                response["explain"] = results.explain
+            g.slow_log_fields = {"query": query, "query_type": getattr(results, "query_type", None), "results": 0,
+                                 "engine": search_executor.served_engine()}
+            return jsonify(response)
         
         # Calculate pagination
         total_results = len(results)
+        g.slow_log_fields = {"query": query, "query_type": results.query_type, "results": total_results,
+                             "engine": search_executor.served_engine()}
         total_pages = max(1, (total_results + per_page - 1) // per_page)
         
         # Get paginated results
         start = (page - 1) * per_page
         end = start + per_page
-        paginated_results = results.iloc[start:end]
+        with telemetry.trace() as timings:
+            paginated_results = clean_movie_data(results.slice(start, end).materialize(fields))
         
-        return jsonify({
+        response = {
             "success": True,
-            "data": clean_movie_data(paginated_results),
+            "data": paginated_results,
             "query": query,
             "page": page,
             "total_pages": total_pages,
             "total_results": total_results
-        })
+        }
+        if explain:
+            response["explain"] = dict(
+                results.explain,
+                page_timings_ms={name: round(sec * 1000, 3) for name, sec in timings.items()}
+            )
+        return jsonify(response)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/search/stream')
+def search_stream():
+    """Server-Sent Events: the first page of results after each search stage
+    (title → filter → content), each event named after its stage, then `done`"""
+    fields, fields_error = requested_fields()
+    if fields_error:
+        return jsonify({"success": False, "error": fields_error}), 400
+    query = request.args.get("query", "").strip()
+    per_page = request.args.get("per_page", 36, type=int)
+    
+    def sse(event, payload):
+        return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+    
+    def generate():
+        started = time.perf_counter()
+        try:
+            if query:
+                for stage, results in search_stages(query, top_n=1000):
+                    yield sse(stage, {
+                        "stage": stage,
+                        "query_type": results.query_type,
+                        "data": clean_movie_data(results.slice(0, per_page).materialize(fields)),
+                        "total_results": len(results),
+                        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+                    })
+            yield sse("done", {"query": query, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)})
+        except Exception as e:
+            yield sse("error", {"success": False, "error": str(e)})
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/movie/<movie_id>')
 def get_movie_detail(movie_id):
     """Get detailed information about a specific movie"""
     try:
-        movie = combined_df.loc[combined_df["id"] == movie_id].to_dict(orient="records")
+        row = movie_id_index.get_indexer([movie_id])[0]
         
-        if not movie:
+        if row < 0:
             return jsonify({
                 "success": False,
                 "error": "Movie not found"
             }), 404
         
-        movie = movie[0]
+        movie = materialize_movies([row])[0]
         
         # Clean movie data
         for key, value in movie.items():
@@ -651,26 +938,29 @@ def get_movie_detail(movie_id):
             # Get all genres from the current movie
             genres = [g.strip().lower() for g in str(movie["genre"]).split(",")]
             
-            # Filter movies that share at least one genre
-            similar_df = combined_df[
-                combined_df["genre"].apply(
-                    lambda x: any(g in str(x).lower() for g in genres) if pd.notna(x) else False
+            with telemetry.stage("similar_movies"):
+                # Filter movies that share at least one genre
+                similar_df = combined_df[
+                    combined_df["genre"].apply(
+                        lambda x: any(g in str(x).lower() for g in genres) if pd.notna(x) else False
+                    )
+                ]
+                
+                # Exclude current movie
+                similar_df = similar_df[similar_df["id"] != movie_id]
+                
+                # Sort by popularity and vote_count to get well-known movies
+                # First by vote_count (minimum threshold for credibility), then by rating
+                similar_df = similar_df[similar_df["vote_count"] > 50000]  # Only movies with significant votes
+                similar_df = similar_df.sort_values(
+                    by=["rating", "vote_count"], 
+                    ascending=[False, False]
                 )
-            ]
-            
-            # Exclude current movie
-            similar_df = similar_df[similar_df["id"] != movie_id]
-            
-            # Sort by popularity and vote_count to get well-known movies
-            # First by vote_count (minimum threshold for credibility), then by rating
-            similar_df = similar_df[similar_df["vote_count"] > 50000]  # Only movies with significant votes
-            similar_df = similar_df.sort_values(
-                by=["rating", "vote_count"], 
-                ascending=[False, False]
-            )
             
             similar_movies = clean_movie_data(similar_df.head(12))
         
+        g.slow_log_fields = {"movie_id": movie_id, "results": len(similar_movies)}
+        
         return jsonify({
             "success": True,
             "data": {
@@ -683,6 +973,148 @@ def get_movie_detail(movie_id):
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+# =====================================
+# Export Routes
+# =====================================
+
+# Rows materialized and serialized per step of an NDJSON export
+EXPORT_CHUNK = int(os.environ.get("EXPORT_CHUNK", 500))
+
+def export_filter_mask(rows):
+    """Boolean mask over `rows` for the optional export filters in the query string"""
+    mask = np.ones(len(rows), dtype=bool)
+    genre = request.args.get('genre')
+    if genre:
+        genres = combined_df["genre"].iloc[rows].astype(str).str.lower()
+        mask &= genres.str.contains(genre.lower(), regex=False).to_numpy()
+    for arg, column, compare in [
+        ('year_min', 'year', np.greater_equal),
+        ('year_max', 'year', np.less_equal),
+        ('min_rating', 'rating', np.greater_equal),
+        ('min_votes', 'vote_count', np.greater_equal),
+    ]:
+        bound = request.args.get(arg, type=float)
+        if bound is not None:
+            values = combined_df[column].iloc[rows].to_numpy(dtype=float, na_value=np.nan)
+            mask &= compare(values, bound)  # NaN compares False: rows without a value drop out
+    return mask
+
+def ndjson_response(rows, fields, scores=None, filename='export'):
+    """Stream rows as NDJSON, EXPORT_CHUNK at a time, gzip-compressed when `gzip=1`"""
+    compress = request.args.get('gzip', '0') in ('1', 'true')
+
+    def generate():
+        compressor = zlib.compressobj(wbits=31) if compress else None  # 31: gzip container
+        for start in range(0, len(rows), EXPORT_CHUNK):
+            chunk = materialize_movies(rows[start:start + EXPORT_CHUNK], fields)
+            for name, values in (scores or {}).items():
+                for movie, value in zip(chunk, values[start:start + EXPORT_CHUNK].tolist()):
+                    movie[name] = value
+            data = "".join(json.dumps(movie, ensure_ascii=False, default=str) + "\n"
+                           for movie in clean_movie_data(chunk)).encode('utf-8')
+            if compressor:
+                data = compressor.compress(data)
+            if data:
+                yield data
+        if compressor:
+            yield compressor.flush()
+
+    # A .gz file, not Content-Encoding: clients would transparently decode the
+    # latter and save plain NDJSON under the .gz name
+    headers = {'Content-Disposition': f'attachment; filename="{filename}.ndjson{".gz" if compress else ""}"'}
+    mimetype = 'application/gzip' if compress else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers=headers)
+
+@app.route('/api/export/movies')
+def export_movies():
+    """Stream the whole catalog (optionally filtered) as NDJSON"""
+    try:
+        fields, fields_error = requested_fields()
+        if fields_error:
+            return jsonify({"success": False, "error": fields_error}), 400
+        
+        rows = np.arange(len(combined_df))
+        rows = rows[export_filter_mask(rows)]
+        return ndjson_response(rows, fields, filename='movies')
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/export/search')
+def export_search():
+    """Stream up to `limit` search results (optionally filtered) as NDJSON, in rank order"""
+    try:
+        fields, fields_error = requested_fields()
+        if fields_error:
+            return jsonify({"success": False, "error": fields_error}), 400
+        
+        query = request.args.get("query", "").strip()
+        if not query:
+            return jsonify({"success": False, "error": "query is required"}), 400
+        limit = request.args.get('limit', 10000, type=int)
+        if limit < 1:
+            return jsonify({"success": False, "error": "limit must be a positive integer"}), 400
+        limit = min(limit, len(combined_df))
+        
+        results = search_executor.search(query, top_n=limit)
+        mask = export_filter_mask(results.rows)
+        scores = {name: values[mask] for name, values in results.scores.items()}
+        return ndjson_response(results.rows[mask], fields, scores, filename='search')
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# =====================================
+# Debug Routes
+# =====================================
+
+@app.route('/api/debug/search-batching')
+def get_search_batching_stats():
+    """Batch-size and queueing-delay metrics of the content-query micro-batcher"""
+    if content_batcher is None:
+        return jsonify({"success": True, "enabled": False})
+    return jsonify({"success": True, "enabled": True, "data": content_batcher.stats()})
+
+@app.route('/api/debug/shards')
+def get_shard_stats():
+    """Per-shard latency and latency spread of scatter-gather search"""
+    if sharded_search is None:
+        return jsonify({"success": True, "enabled": False})
+    return jsonify({"success": True, "enabled": True, "data": sharded_search.stats()})
+
+@app.route('/api/debug/memory')
+def get_memory_stats():
+    """Bytes held by each engine structure next to this worker's RSS/PSS/USS"""
+    try:
+        engine = engine_memory()
+        engine["cosave_index"] = cosave_index.memory()
+        engine["profile_cache"] = profile_cache_memory()
+        
+        accounted = (
+            engine["movie_store"]["total_bytes"]
+            + engine["tfidf_matrix"]["total_bytes"]
+            + sum(v for k, v in engine["vectorizer"].items() if k.endswith("_bytes"))
+            + engine["vector_search_cache"]["estimated_bytes"]
+            + sum(engine["indexes"].values())
+            + engine["cosave_index"]["matrix_bytes"] + engine["cosave_index"]["estimated_delta_bytes"]
+            + engine["profile_cache"]["bytes"]
+        )
+        return jsonify({
+            "success": True,
+            "data": {
+                "pid": os.getpid(),
+                "process": process_memory(),
+                "engine": engine,
+                "accounted_bytes": accounted
+            }
+        })
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/metrics')
+def get_metrics():
+    """Prometheus text format: stage timings, endpoint latency and cache hit ratios,
+    summed over every worker that flushed to METRICS_DIR"""
+    return Response(telemetry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 # =====================================
 # Serve React Frontend - Catch-all route (must be LAST)
 # =====================================
@@ -717,6 +1149,8 @@ def serve_react(path):
     # For all other routes, serve index.html and let React Router handle it
     return send_from_directory(app.static_folder, 'index.html')
 
+startup.report()
+
 # =====================================
 # Run server
 # =====================================
@@ -0,0 +1,65 @@
+# =====================================
+# db.py — Pooled SQLite connections (one per thread, per worker process)
+# =====================================
+
+import os
+import sqlite3
+import threading
+
+DB_PATH = "checkpoints/movies.db"
+
+# Applied to every new connection. WAL lets readers proceed while a writer
+# commits, NORMAL sync is durable enough under WAL, and a large page cache +
+# mmap keeps hot pages of the movies table out of read() syscalls.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -16000",  # KiB, i.e. ~16 MB per connection
+    "PRAGMA mmap_size = 268435456",  # 256 MB
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA foreign_keys = ON",
+)
+
+# sqlite3 keeps this many compiled statements per connection, keyed by SQL
+# text, so the fixed queries in the routes are prepared once per thread.
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+
+
+def _connect():
+    conn = sqlite3.connect(DB_PATH, timeout=5.0, cached_statements=STATEMENT_CACHE_SIZE)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def get_db():
+    """Get this thread's pooled connection, opening it on first use.
+
+    Connections are never shared across threads or forked workers: a
+    connection inherited from the gunicorn master is discarded and reopened.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        conn = _connect()
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def release_db(exc=None):
+    """Return the connection to the pool, rolling back anything left uncommitted"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid() and conn.in_transaction:
+        conn.rollback()
+
+
+def close_db():
+    """Close this thread's pooled connection"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
@@ -1,6 +1,9 @@
 // API base URL - will use Vite proxy in development
 const API_BASE_URL = import.meta.env.VITE_API_URL || '/api';
 
+// Column preset for list views: only what MovieCard renders
+const CARD_FIELDS = 'card';
+
 /**
  * Generic API request handler
  */
@@ -44,21 +47,21 @@ export const api = {
    * Get top rated movies
    */
   async getTopRatedMovies(limit = 20) {
-    return apiRequest(`/movies/top-rated?limit=${limit}`);
+    return apiRequest(`/movies/top-rated?limit=${limit}&fields=${CARD_FIELDS}`);
   },
 
   /**
    * Get movies by genre
    */
   async getMoviesByGenre(genre, limit = 20) {
-    return apiRequest(`/movies/genre/${encodeURIComponent(genre)}?limit=${limit}`);
+    return apiRequest(`/movies/genre/${encodeURIComponent(genre)}?limit=${limit}&fields=${CARD_FIELDS}`);
   },
 
   /**
    * Get all genres with movies
    */
   async getAllGenres() {
-    return apiRequest('/genres');
+    return apiRequest(`/genres?fields=${CARD_FIELDS}`);
   },
 
   /**
@@ -69,10 +72,47 @@ export const api = {
       query,
       page: page.toString(),
       per_page: perPage.toString(),
+      fields: CARD_FIELDS,
     });
     return apiRequest(`/search?${params}`);
   },
 
+  /**
+   * Progressive search over Server-Sent Events.
+   * onStage(stage, payload) is called for each stage ("title", "filter", "content");
+   * later stages replace earlier ones. Returns a function that closes the stream.
+   */
+  streamSearch(query, onStage, { perPage = 36, onDone, onError } = {}) {
+    const params = new URLSearchParams({
+      query,
+      per_page: perPage.toString(),
+      fields: CARD_FIELDS,
+    });
+    const source = new EventSource(`${API_BASE_URL}/search/stream?${params}`);
+    ['title', 'filter', 'content'].forEach(stage => {
+      source.addEventListener(stage, event => onStage(stage, JSON.parse(event.data)));
+    });
+    source.addEventListener('done', event => {
+      source.close();
+      if (onDone) onDone(JSON.parse(event.data));
+    });
+    source.addEventListener('error', event => {
+      source.close();
+      if (onError) onError(event.data ? JSON.parse(event.data) : event);
+    });
+    return () => source.close();
+  },
+
+  /**
+   * Get several movies in one request, in the order of `ids`
+   */
+  async getMoviesByIds(ids, fields = CARD_FIELDS) {
+    return apiRequest(`/movies?fields=${fields}`, {
+      method: 'POST',
+      body: JSON.stringify({ ids }),
+    });
+  },
+
   /**
    * Get movie by ID
    */
@@ -48,9 +48,15 @@ export const movieService = {
     return response.data;
   },
 
+  async getMoviesByIds(ids, fields) {
+    if (!ids.length) return [];
+    const response = await api.getMoviesByIds(ids, fields);
+    return response.data;
+  },
+
   // Favorites/Watchlist functions
   async getFavorites(status = null) {
-    const url = status ? `/api/favorites?status=${status}` : '/api/favorites';
+    const url = status ? `/api/favorites?status=${status}&fields=card` : '/api/favorites?fields=card';
     const response = await fetch(url, {
       credentials: 'include',
     });
@@ -0,0 +1,42 @@
+# =====================================
+# gunicorn.conf.py — Preloaded, copy-on-write friendly multi-worker setup
+# Usage: gunicorn -c gunicorn.conf.py app:app
+# =====================================
+
+import gc
+import multiprocessing
+import os
+
+# /api/metrics sums the per-process snapshots flushed here; without it each scrape
+# sees only the worker that answered. Set before preload imports telemetry.
+os.environ.setdefault("METRICS_DIR", "metrics")
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+# With SEARCH_POOL_WORKERS > 0 searches run in a process pool, so a few threads per
+# worker keep light endpoints responsive while a request waits on the pool.
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+
+# Load the engine (spaCy model, movie store, TF-IDF matrix) once in the master;
+# workers inherit it through fork and share the pages copy-on-write.
+preload_app = True
+
+# Keep the collector from touching (and dirtying) the preloaded objects while the
+# master builds them. Workers re-enable it after fork.
+gc.disable()
+
+
+def on_starting(server):
+    # Per-process metric snapshots of a previous run would be summed into /api/metrics
+    import telemetry
+    telemetry.clear_dir()
+
+
+def pre_fork(server, worker):
+    from process import prepare_for_fork
+    prepare_for_fork()
+
+
+def post_fork(server, worker):
+    gc.enable()
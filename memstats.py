@@ -0,0 +1,65 @@
+# =====================================
+# memstats.py — Process memory readings (RSS / PSS / USS) from /proc
+# =====================================
+
+import os
+import resource
+
+
+def _read_kib_fields(path, fields):
+    values = {}
+    with open(path) as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in fields:
+                values[key] = int(rest.split()[0]) * 1024
+    return values
+
+
+def process_memory(pid="self"):
+    """Return {"rss", "pss", "uss", "shared"} in bytes for a process.
+
+    USS (private pages) and PSS (private + proportional share of shared pages)
+    come from /proc/<pid>/smaps_rollup on Linux. Elsewhere only RSS is known
+    and the other fields are None.
+    """
+    try:
+        fields = _read_kib_fields(
+            f"/proc/{pid}/smaps_rollup",
+            {"Rss", "Pss", "Private_Clean", "Private_Dirty", "Shared_Clean", "Shared_Dirty"},
+        )
+        return {
+            "rss": fields["Rss"],
+            "pss": fields["Pss"],
+            "uss": fields["Private_Clean"] + fields["Private_Dirty"],
+            "shared": fields["Shared_Clean"] + fields["Shared_Dirty"],
+        }
+    except (OSError, KeyError):
+        pass
+
+    try:
+        rss = _read_kib_fields(f"/proc/{pid}/status", {"VmRSS"})["VmRSS"]
+    except (OSError, KeyError):
+        if pid not in ("self", os.getpid()):
+            raise
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        rss = maxrss if os.uname().sysname == "Darwin" else maxrss * 1024
+    return {"rss": rss, "pss": None, "uss": None, "shared": None}
+
+
+def child_pids(pid):
+    """List the direct children of pid (e.g. gunicorn workers of the master)"""
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; ppid follows the closing paren
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return sorted(children)
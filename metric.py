@@ -1,38 +1,228 @@
+"""Search evaluation: P@10, MAP and nDCG@10 with per-query latency, for one or more engine configurations.
+
+Usage:
+    python metric.py                                   # current environment
+    python metric.py --workers 8 --top-n 100 --out eval.json
+    python metric.py --config base: --config pop0:SEARCH_POPULARITY_WEIGHT=0
+    python metric.py --config inline: --config batched:SEARCH_BATCH_WINDOW_MS=5 --workers 16
+
+Queries come from evaluation_queries.json: {"query": ..., "relevant": [...]}.
+A relevant entry is a catalog row position (int) or a movie id ("tt..."). Every
+query type counts; only the ranked rows are used, not the per-branch scores.
+
+Queries run concurrently on --workers threads through search_executor.search.
+So the configured engine path is what gets measured: inline, the process pool
+(SEARCH_POOL_WORKERS), shards (SEARCH_SHARDS), or micro-batched content
+scoring (SEARCH_BATCH_WINDOW_MS). Latency is measured per query under that
+concurrency.
+
+Each --config NAME:VAR=VALUE,... runs in its own process with those
+environment overrides, because the engine reads its settings at import. The
+results are printed side by side.
+"""
+
+import argparse
+import contextlib
+import io
 import json
-from process import smart_search
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+QUERIES_PATH = "evaluation_queries.json"
+K = 10
+
 
-def precision_at_k(results, relevant, k=10):
-    hits = sum(1 for doc_id, _ in results[:k] if doc_id in relevant)
+def precision_at_k(ranked, relevant, k=K):
+    hits = sum(1 for row in ranked[:k] if row in relevant)
     return hits / k
 
-def average_precision(results, relevant):
+
+def average_precision(ranked, relevant):
     hits, sum_prec = 0, 0
-    for i, (doc_id, _) in enumerate(results):
-        if doc_id in relevant:
+    for i, row in enumerate(ranked):
+        if row in relevant:
             hits += 1
             sum_prec += hits / (i + 1)
     return sum_prec / len(relevant) if relevant else 0
 
-def evaluate():
-    with open("evaluation_queries.json", "r", encoding="utf-8") as f:
-        queries = json.load(f)
 
-    precisions, maps = [], []
+def ndcg_at_k(ranked, relevant, k=K):
+    """Binary-gain nDCG: each relevant row in the top k counts 1 / log2(rank + 1)"""
+    dcg = sum(1 / math.log2(i + 2) for i, row in enumerate(ranked[:k]) if row in relevant)
+    ideal = sum(1 / math.log2(i + 2) for i in range(min(len(relevant), k)))
+    return dcg / ideal if ideal else 0
+
+
+def resolve_relevant(relevant, movie_id_index):
+    """Row positions for a mix of row positions and movie ids; unknown ids and out-of-range rows are dropped"""
+    rows = {r for r in relevant if isinstance(r, int) and 0 <= r < len(movie_id_index)}
+    ids = [r for r in relevant if isinstance(r, str)]
+    if ids:
+        positions = movie_id_index.get_indexer(ids)
+        rows.update(int(p) for p in positions if p >= 0)
+    return rows
+
+
+def evaluate(queries, workers=4, top_n=100):
+    """Run every query through the configured engine path; per-query metrics and latency"""
+    # The engine loads on import; only the process that evaluates pays for it
+    from process import movie_id_index
+    import search_executor
+
+    def run(q):
+        started = time.perf_counter()
+        result = search_executor.search(q["query"], top_n=top_n)
+        return result, time.perf_counter() - started
+
+    with contextlib.redirect_stdout(io.StringIO()):  # smart_search prints every detected type
+        search_executor.search("warm up", top_n=1)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            started = time.perf_counter()
+            outcomes = list(pool.map(run, queries))
+            wall = time.perf_counter() - started
 
-    for q in queries:
-        df = smart_search(q["query"], min_score=0.0)
-        results = [(idx, row["similarity_score"]) for idx, row in df.iterrows()]
+    per_query = []
+    for q, (result, elapsed) in zip(queries, outcomes):
+        ranked = result.rows.tolist()
+        relevant = resolve_relevant(q["relevant"], movie_id_index)
+        if not relevant:
+            print(f"⚠️ {q['query']!r}: no relevant entry matches a catalog row, so it scores 0", file=sys.stderr)
+        elif len(relevant) < len(q["relevant"]):
+            print(f"⚠️ {q['query']!r}: {len(q['relevant']) - len(relevant)} of {len(q['relevant'])} relevant "
+                  f"entries match no catalog row", file=sys.stderr)
+        per_query.append({
+            "query": q["query"],
+            "query_type": result.query_type,
+            "results": len(ranked),
+            "relevant": len(relevant),
+            "p_at_10": precision_at_k(ranked, relevant),
+            "ap": average_precision(ranked, relevant),
+            "ndcg_at_10": ndcg_at_k(ranked, relevant),
+            "latency_ms": round(elapsed * 1000, 3),
+        })
+    return {
+        "engine": search_executor.engine(),
+        "workers": workers,
+        "top_n": top_n,
+        "wall_seconds": round(wall, 3),
+        "queries": per_query,
+        "summary": summarize(per_query, wall),
+    }
 
-        p10 = precision_at_k(results, q["relevant"], 10)
-        ap = average_precision(results, q["relevant"])
-        precisions.append(p10)
-        maps.append(ap)
 
-        print(f"{q['query']}: P@10 = {p10:.2f}, AP = {ap:.2f}")
+def summarize(per_query, wall):
+    latencies = [q["latency_ms"] for q in per_query]
+    return {
+        "mean_p_at_10": float(np.mean([q["p_at_10"] for q in per_query])),
+        "map": float(np.mean([q["ap"] for q in per_query])),
+        "mean_ndcg_at_10": float(np.mean([q["ndcg_at_10"] for q in per_query])),
+        "latency_p50_ms": float(np.percentile(latencies, 50)),
+        "latency_p95_ms": float(np.percentile(latencies, 95)),
+        "queries_per_s": len(per_query) / wall if wall else 0.0,
+    }
+
+
+def print_report(report):
+    for q in report["queries"]:
+        print(f"{q['query']} [{q['query_type']}]: P@10 = {q['p_at_10']:.2f}, AP = {q['ap']:.2f}, "
+              f"nDCG@10 = {q['ndcg_at_10']:.2f}, {q['latency_ms']:.1f} ms")
+    s = report["summary"]
+    print(f"\n📊 Mean Precision@10: {s['mean_p_at_10']:.4f}")
+    print(f"📊 MAP: {s['map']:.4f}")
+    print(f"📊 Mean nDCG@10: {s['mean_ndcg_at_10']:.4f}")
+    print(f"⏱️ Latency p50 {s['latency_p50_ms']:.1f} ms, p95 {s['latency_p95_ms']:.1f} ms, "
+          f"{s['queries_per_s']:.1f} queries/s ({report['engine']}, {report['workers']} workers)")
+
+
+# =====================================
+# Side-by-side comparison of engine configurations
+# =====================================
+
+def parse_config(spec):
+    """"name:VAR=VALUE,VAR=VALUE" → (name, {VAR: VALUE}); "name:" is the unchanged environment"""
+    name, _, assignments = spec.partition(":")
+    overrides = {}
+    for item in filter(None, assignments.split(",")):
+        var, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"Expected VAR=VALUE in --config {spec!r}, got {item!r}")
+        overrides[var.strip()] = value.strip()
+    return name or "default", overrides
+
+
+def evaluate_in_subprocess(overrides, args):
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        out_path = f.name
+    try:
+        cmd = [sys.executable, os.path.abspath(__file__), "--queries", args.queries,
+               "--workers", str(args.workers), "--top-n", str(args.top_n), "--json-only", out_path]
+        subprocess.run(cmd, env={**os.environ, **overrides}, stdout=subprocess.DEVNULL, check=True)
+        with open(out_path, encoding="utf-8") as f:
+            return json.load(f)
+    finally:
+        os.remove(out_path)
+
+
+def print_comparison(reports):
+    names = list(reports)
+    col = max(22, *(len(n) + 2 for n in names))
+    print(f"\n{'query':<32}" + "".join(f"{n:>{col}}" for n in names) + "   (P@10 / AP / nDCG@10 / ms)")
+    for i, q in enumerate(reports[names[0]]["queries"]):
+        cells = []
+        for name in names:
+            r = reports[name]["queries"][i]
+            cells.append(f"{r['p_at_10']:.2f}/{r['ap']:.2f}/{r['ndcg_at_10']:.2f}/{r['latency_ms']:.0f}".rjust(col))
+        print(f"{q['query'][:31]:<32}" + "".join(cells))
+
+    print(f"\n{'metric':<20}" + "".join(f"{n:>{col}}" for n in names)
+          + (f"{'Δ':>10}" if len(names) == 2 else ""))
+    for key in ("mean_p_at_10", "map", "mean_ndcg_at_10", "latency_p50_ms", "latency_p95_ms", "queries_per_s"):
+        values = [reports[n]["summary"][key] for n in names]
+        delta = f"{values[1] - values[0]:>+10.4f}" if len(values) == 2 else ""
+        print(f"{key:<20}" + "".join(f"{v:>{col}.4f}" for v in values) + delta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", default=QUERIES_PATH)
+    parser.add_argument("--workers", type=int, default=4, help="queries in flight at once")
+    parser.add_argument("--top-n", type=int, default=100, help="results ranked per query (AP uses all of them)")
+    parser.add_argument("--config", action="append", default=[],
+                        help="NAME:VAR=VALUE,... engine environment overrides; repeat to compare")
+    parser.add_argument("--out", help="write the report(s) as JSON")
+    parser.add_argument("--json-only", help=argparse.SUPPRESS)  # used by --config subprocesses
+    args = parser.parse_args()
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        queries = json.load(f)
+
+    if args.config:
+        configs = dict(parse_config(spec) for spec in args.config)
+        reports = {}
+        for name, overrides in configs.items():
+            print(f"⚙️ {name}: {overrides or 'current environment'}")
+            reports[name] = dict(evaluate_in_subprocess(overrides, args), overrides=overrides)
+        print_comparison(reports)
+        result = reports
+    else:
+        result = evaluate(queries, args.workers, args.top_n)
+        if args.json_only:
+            with open(args.json_only, "w", encoding="utf-8") as f:
+                json.dump(result, f)
+            return
+        print_report(result)
 
-    print("\n📊 Mean Precision@10:", sum(precisions) / len(precisions))
-    print("📊 MAP:", sum(maps) / len(maps))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
 
 
 if __name__ == "__main__":
-    evaluate()
+    main()
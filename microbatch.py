@@ -0,0 +1,136 @@
+# =====================================
+# microbatch.py — Coalesce concurrent calls into one batched computation
+# =====================================
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+# Upper bounds of the batch-size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+_init_lock = threading.Lock()
+
+
+class MicroBatcher:
+    """Collect keys submitted within `window` seconds (or up to `max_batch`) and
+    score them with one score_batch(keys) call, which must return one result per key.
+
+    Identical keys already queued or being scored share a single result
+    (singleflight), so a burst of the same query is computed once.
+    """
+
+    def __init__(self, score_batch, window=0.002, max_batch=32):
+        self._score_batch = score_batch
+        self._window = window
+        self._max_batch = max_batch
+        self._pid = None
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._batches = 0
+        self._queries = 0
+        self._deduplicated = 0
+        self._max_seen = 0
+        self._size_buckets = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self._queue_delays = deque(maxlen=1024)
+        self._batch_durations = deque(maxlen=1024)
+
+    def _ensure_worker(self):
+        # Threads and locks don't survive fork: each process starts its own worker
+        if self._pid == os.getpid():
+            return
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._queue = []
+        self._inflight = {}
+        self._reset_stats()
+        self._pid = os.getpid()
+        threading.Thread(target=self._run, name="microbatch", daemon=True).start()
+
+    def submit(self, key):
+        """Block until the batch containing key has been scored and return its result"""
+        if self._pid != os.getpid():
+            with _init_lock:
+                self._ensure_worker()
+        with self._cond:
+            self._queries += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self._deduplicated += 1
+            else:
+                future = Future()
+                self._inflight[key] = future
+                self._queue.append((key, future, time.perf_counter()))
+                self._cond.notify()
+        return future.result()
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            deadline = self._queue[0][2] + self._window
+            while len(self._queue) < self._max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._queue[:self._max_batch]
+            del self._queue[:self._max_batch]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            started = time.perf_counter()
+            keys = [key for key, _, _ in batch]
+            try:
+                results = self._score_batch(keys)
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            finished = time.perf_counter()
+
+            with self._cond:
+                for key in keys:
+                    self._inflight.pop(key, None)
+                self._batches += 1
+                self._max_seen = max(self._max_seen, len(batch))
+                bucket = next((i for i, b in enumerate(BATCH_SIZE_BUCKETS) if len(batch) <= b), -1)
+                self._size_buckets[bucket] += 1
+                self._queue_delays.extend(started - enqueued for _, _, enqueued in batch)
+                self._batch_durations.append(finished - started)
+
+    def stats(self):
+        """Batch-size and queueing-delay figures for this process"""
+        if self._pid != os.getpid():
+            return {"batches": 0, "queries": 0}
+        with self._cond:
+            delays = np.asarray(self._queue_delays) * 1000
+            durations = np.asarray(self._batch_durations) * 1000
+            labels = [f"<={b}" for b in BATCH_SIZE_BUCKETS] + [f">{BATCH_SIZE_BUCKETS[-1]}"]
+            return {
+                "window_ms": self._window * 1000,
+                "max_batch": self._max_batch,
+                "batches": self._batches,
+                "queries": self._queries,
+                "deduplicated": self._deduplicated,
+                "mean_batch_size": (self._queries - self._deduplicated) / self._batches if self._batches else 0.0,
+                "max_batch_size": self._max_seen,
+                "batch_size_histogram": dict(zip(labels, self._size_buckets)),
+                "queue_delay_ms": {
+                    "mean": float(delays.mean()) if len(delays) else 0.0,
+                    "p95": float(np.percentile(delays, 95)) if len(delays) else 0.0,
+                    "max": float(delays.max()) if len(delays) else 0.0,
+                },
+                "batch_duration_ms": {
+                    "mean": float(durations.mean()) if len(durations) else 0.0,
+                    "max": float(durations.max()) if len(durations) else 0.0,
+                },
+            }
@@ -2,9 +2,14 @@
 # process.py — Movie Search Engine Logic (tối ưu + cache)
 # =====================================
 
+import startup  # đặt đầu tiên: đo cả thời gian import thư viện
 import os
+import gc
 import glob
 import re
+import sys
+import threading
+import time
 import pandas as pd
 import nltk
 import spacy
@@ -15,6 +20,17 @@ from functools import lru_cache
 from nltk.corpus import stopwords
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import linear_kernel
+from db import get_db, close_db
+from microbatch import MicroBatcher
+import telemetry
+
+try:
+    import pyarrow  # noqa: F401 — chuỗi Arrow gọn hơn nhiều so với object của Python
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    STRING_DTYPE = object
+
+startup.checkpoint("import_libraries")
 
 # =====================================
 # Đường dẫn file database & model TF-IDF
@@ -30,6 +46,7 @@ try:
     nltk.data.find("corpora/stopwords")
 except LookupError:
     nltk.download("stopwords", quiet=True)
+startup.checkpoint("nltk_stopwords")
 
 try:
     nlp = spacy.load("en_core_web_sm")
@@ -37,6 +54,7 @@ except OSError:
     from spacy.cli import download
     download("en_core_web_sm")
     nlp = spacy.load("en_core_web_sm")
+startup.checkpoint("spacy_load")
 
 # =====================================
 # Hàm làm sạch văn bản
@@ -50,20 +68,107 @@ def clean_text_spacy(text):
     tokens = [token.lemma_ for token in doc if token.text not in stop_words and token.text.strip()]
     return " ".join(tokens)
 
+# =====================================
+# Kho dữ liệu phục vụ (serving store)
+# =====================================
+# Chỉ các cột nóng nằm trong RAM, với kiểu dữ liệu gọn. cast/director vẫn được giữ
+# vì tìm kiếm theo người quét trực tiếp hai cột này.
+STORE_DTYPES = {
+    "id": STRING_DTYPE,
+    "title": STRING_DTYPE,
+    "year": "Int16",
+    "runtime": "Int16",
+    "rating": "float64",
+    "vote_count": "Int32",
+    "popularity": "float64",
+    "poster_url": STRING_DTYPE,
+    "genre": "category",
+    "director": STRING_DTYPE,
+    "cast": STRING_DTYPE,
+}
+# Cột dẫn xuất chỉ dùng khi dựng TF-IDF, không bao giờ trả về client
+DERIVED_COLUMNS = ["clean_title", "clean_plot", "clean_genres", "weighted_text", "poster"]
+
+
+def build_movie_store(df):
+    """Chuyển DataFrame thô thành kho phục vụ chỉ gồm các cột nóng với kiểu gọn."""
+    store = {}
+    for col, dtype in STORE_DTYPES.items():
+        if col not in df.columns:
+            continue
+        values = df[col]
+        if str(dtype).startswith("Int"):
+            values = pd.to_numeric(values, errors="coerce").round()
+        elif dtype == "float64":
+            values = pd.to_numeric(values, errors="coerce")
+        store[col] = values.astype(dtype)
+    return pd.DataFrame(store, index=pd.RangeIndex(len(df)))
+
+
+def movie_table_columns():
+    conn = get_db()
+    return [row[1] for row in conn.execute("PRAGMA table_info(movies)")]
+
+# =====================================
+# Dựng chỉ mục TF-IDF (dùng khi khởi tạo từ CSV và trong benchmark)
+# =====================================
+TITLE_WEIGHT, GENRE_WEIGHT, PLOT_WEIGHT = 3, 2, 1
+
+
+def combine_weighted_text(row):
+    return (
+        (row["clean_title"] + " ") * TITLE_WEIGHT
+        + (row["clean_genres"] + " ") * GENRE_WEIGHT
+        + (row["clean_plot"] + " ") * PLOT_WEIGHT
+    )
+
+
+def prepare_index_text(df):
+    """Thêm (tại chỗ) các cột làm sạch và weighted_text vào DataFrame thô đọc từ CSV."""
+    df["clean_title"] = df["title"].apply(clean_text_spacy)
+    df["clean_plot"] = df["plot"].apply(clean_text_spacy)
+    if "genre" in df.columns:
+        df["clean_genres"] = df["genre"].apply(clean_text_spacy)
+    else:
+        df["clean_genres"] = ""
+
+    if "poster" not in df.columns and "poster_url" in df.columns:
+        df["poster"] = df["poster_url"]
+
+    df["weighted_text"] = df.apply(combine_weighted_text, axis=1)
+    return df
+
+
+def build_tfidf_index(weighted_text):
+    """Fit TF-IDF trên weighted_text → (vectorizer, ma trận CSR)."""
+    vectorizer = TfidfVectorizer()
+    matrix = vectorizer.fit_transform(weighted_text)
+    return vectorizer, matrix
+
 # =====================================
 # Load database + TF-IDF model (nếu có)
 # =====================================
 if os.path.exists(DB_PATH) and os.path.exists(VEC_PATH) and os.path.exists(MATRIX_PATH):
     print("✅ Phát hiện file database & model — load nhanh!")
 
+    # Chỉ đọc rowid + cột nóng; văn bản lớn (plot, awards, ...) đọc lười khi cần
+    store_cols = [c for c in movie_table_columns() if c in STORE_DTYPES]
     conn = sqlite3.connect(DB_PATH)
-    combined_df = pd.read_sql_query("SELECT * FROM movies", conn)
+    raw_df = pd.read_sql_query(
+        "SELECT rowid AS _rowid, " + ", ".join(f'"{c}"' for c in store_cols) + " FROM movies",
+        conn,
+    )
     conn.close()
+    movie_rowids = raw_df["_rowid"].to_numpy(dtype=np.int64)
+    combined_df = build_movie_store(raw_df)
+    del raw_df
+    startup.checkpoint("read_sql_movies")
 
     with open(VEC_PATH, "rb") as f:
         vectorizer = pickle.load(f)
     with open(MATRIX_PATH, "rb") as f:
         tfidf_matrix = pickle.load(f)
+    startup.checkpoint("unpickle_tfidf")
 
 else:
     print("⚙️ Không tìm thấy dữ liệu cũ — khởi tạo từ CSV...")
@@ -75,30 +180,10 @@ else:
 
     print(f"✅ Đã đọc {len(all_files)} file CSV, tổng {len(combined_df)} dòng.")
 
-    combined_df["clean_title"] = combined_df["title"].apply(clean_text_spacy)
-    combined_df["clean_plot"] = combined_df["plot"].apply(clean_text_spacy)
-    if "genre" in combined_df.columns:
-        combined_df["clean_genres"] = combined_df["genre"].apply(clean_text_spacy)
-    else:
-        combined_df["clean_genres"] = ""
-
-    if "poster" not in combined_df.columns and "poster_url" in combined_df.columns:
-        combined_df["poster"] = combined_df["poster_url"]
-
-    title_weight, genre_weight, plot_weight = 3, 2, 1
-
-    def combine_weighted_text(row):
-        return (
-            (row["clean_title"] + " ") * title_weight
-            + (row["clean_genres"] + " ") * genre_weight
-            + (row["clean_plot"] + " ") * plot_weight
-        )
-
-    combined_df["weighted_text"] = combined_df.apply(combine_weighted_text, axis=1)
+    prepare_index_text(combined_df)
     print("✅ Chuẩn bị dữ liệu TF-IDF...")
 
-    vectorizer = TfidfVectorizer()
-    tfidf_matrix = vectorizer.fit_transform(combined_df["weighted_text"])
+    vectorizer, tfidf_matrix = build_tfidf_index(combined_df["weighted_text"])
     print(f"✅ TF-IDF matrix: {tfidf_matrix.shape}")
 
     conn = sqlite3.connect(DB_PATH)
@@ -112,15 +197,101 @@ else:
 
     print("💾 Lưu database & TF-IDF model thành công!")
 
+    # to_sql ghi các dòng theo thứ tự nên rowid = vị trí + 1
+    movie_rowids = np.arange(1, len(combined_df) + 1, dtype=np.int64)
+    combined_df = build_movie_store(combined_df)
+    startup.checkpoint("build_from_csv")
+
+# Cột còn lại của bảng movies được đọc lười từ SQLite theo rowid
+MOVIE_COLUMNS = [c for c in movie_table_columns() if c not in DERIVED_COLUMNS]
+LAZY_COLUMNS = [c for c in MOVIE_COLUMNS if c not in combined_df.columns]
+LAZY_FETCH_CHUNK = 500
+
+
+def fetch_lazy_fields(rows, columns):
+    """Đọc các cột văn bản lớn từ SQLite theo rowid, chỉ cho những dòng cần trả về."""
+    rowids = movie_rowids[np.asarray(rows, dtype=np.intp)].tolist()
+    if not columns or not rowids:
+        return [{} for _ in rowids]
+    col_sql = ", ".join(f'"{c}"' for c in columns)
+    fetched = {}
+    conn = get_db()
+    for start in range(0, len(rowids), LAZY_FETCH_CHUNK):
+        chunk = rowids[start:start + LAZY_FETCH_CHUNK]
+        placeholders = ", ".join("?" * len(chunk))
+        cursor = conn.execute(f"SELECT rowid, {col_sql} FROM movies WHERE rowid IN ({placeholders})", chunk)
+        for row in cursor:
+            fetched[row[0]] = dict(zip(columns, tuple(row)[1:]))
+    return [fetched.get(rowid, {}) for rowid in rowids]
+
+
+def materialize_movies(rows, columns=None):
+    """Dựng dict phim (theo đúng thứ tự rows) từ cột nóng + cột đọc lười."""
+    rows = np.asarray(rows, dtype=np.intp)
+    columns = MOVIE_COLUMNS if columns is None else columns
+    hot = [c for c in columns if c in combined_df.columns]
+    lazy = [c for c in columns if c in LAZY_COLUMNS]
+    with telemetry.stage("materialize"):
+        movies = combined_df.iloc[rows, combined_df.columns.get_indexer(hot)].to_dict(orient="records")
+        if lazy:
+            for movie, extra in zip(movies, fetch_lazy_fields(rows, lazy)):
+                movie.update(extra)
+    return movies
+
+# =====================================
+# Chỉ mục id phim → vị trí dòng trong combined_df / tfidf_matrix
+# =====================================
+movie_id_index = pd.Index(combined_df["id"])
+
+
+def top_k_indices(scores, k, exclude=None):
+    """Trả về vị trí của k điểm cao nhất (giảm dần), dùng argpartition thay vì sort toàn bộ."""
+    scores = np.asarray(scores, dtype=float)
+    if exclude is not None and len(exclude):
+        scores = scores.copy()
+        scores[exclude] = -np.inf
+    k = min(k, int(np.isfinite(scores).sum()))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k >= len(scores):
+        top = np.argsort(scores)[::-1]
+    else:
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(scores[top])[::-1]]
+    return top[:k]
+
+# =====================================
+# Chế độ preload cho nhiều worker (gunicorn --preload)
+# =====================================
+def prepare_for_fork():
+    """Gọi trong tiến trình master ngay trước khi fork worker.
+
+    Mảng NumPy của tfidf_matrix / kho phục vụ được khóa chỉ-đọc để không worker nào
+    vô tình ghi (và sao chép) trang nhớ dùng chung. gc.freeze() chuyển mọi đối tượng
+    hiện có sang thế hệ vĩnh viễn nên bộ gom rác của worker không chạm vào — và không
+    làm bẩn — các trang kế thừa từ master.
+    """
+    for arr in (tfidf_matrix.data, tfidf_matrix.indices, tfidf_matrix.indptr, movie_rowids):
+        arr.setflags(write=False)
+    close_db()  # kết nối SQLite không được dùng chung qua fork
+    gc.collect()
+    gc.freeze()
+
 # =====================================
 # Nhận dạng loại truy vấn
 # =====================================
 def detect_query_type(query, df):
+    return explain_query_type(query, df)[0]
+
+
+def explain_query_type(query, df):
+    """(loại truy vấn, lý do) — lý do trả về cho client qua explain=1."""
     q = query.lower().strip()
 
     # 1️⃣ Năm
-    if re.search(r"\b(19|20)\d{2}\b", q):
-        return "year"
+    year = re.search(r"\b(19|20)\d{2}\b", q)
+    if year:
+        return "year", f"contains a year ({year.group()})"
 
     # 2️⃣ Thể loại
     all_genres = set()
@@ -131,100 +302,387 @@ def detect_query_type(query, df):
                 if gg:
                     all_genres.add(gg)
     if q in all_genres:
-        return "genre"
+        return "genre", f"equals a genre name ({q!r})"
 
     # 3️⃣ Người (diễn viên/đạo diễn)
     for col in ["cast", "director"]:
         if col in df.columns:
             if any(q in str(x).lower() for x in df[col].dropna().head(3000)):
-                return "person"
+                return "person", f"substring of {col} in the first 3000 movies"
 
     # 4️⃣ Tên phim
     if any(q == str(t).lower() for t in df["title"].dropna()):
-        return "title"
+        return "title", "equals a movie title"
 
     # 5️⃣ Mặc định
-    return "content"
+    return "content", "no year, genre, person or exact title match"
 
 # =====================================
 # Cache hóa bước TF-IDF để tăng tốc độ
 # =====================================
+def score_content_batch(queries_clean):
+    """Chấm điểm nhiều query cùng lúc bằng một phép nhân ma trận thưa duy nhất."""
+    with telemetry.stage("vectorize"):
+        query_vecs = vectorizer.transform(queries_clean)
+    with telemetry.stage("score"):
+        cosine_sims = linear_kernel(query_vecs, tfidf_matrix)
+    return [row.copy() for row in cosine_sims]
+
+
+# Gom các truy vấn nội dung đến gần như đồng thời (bật bằng SEARCH_BATCH_WINDOW_MS > 0)
+SEARCH_BATCH_WINDOW_MS = float(os.environ.get("SEARCH_BATCH_WINDOW_MS", 0))
+SEARCH_BATCH_MAX = int(os.environ.get("SEARCH_BATCH_MAX", 32))
+content_batcher = (
+    MicroBatcher(score_content_batch, window=SEARCH_BATCH_WINDOW_MS / 1000, max_batch=SEARCH_BATCH_MAX)
+    if SEARCH_BATCH_WINDOW_MS > 0 else None
+)
+
+
+# Thân hàm chỉ chạy khi cache miss, và chạy trên chính luồng gọi: cờ theo luồng cho
+# biết lần gọi này có phải tính lại không (bộ đếm hits toàn cục bị luồng khác làm lệch)
+_vector_search_call = threading.local()
+
+
 @lru_cache(maxsize=256)
 def cached_vector_search(query_clean):
     """Trả về chỉ số & điểm cosine_similarity của query đã được vector hóa."""
-    query_vec = vectorizer.transform([query_clean])
-    cosine_sim = linear_kernel(query_vec, tfidf_matrix).flatten()
+    _vector_search_call.missed = True
+    if content_batcher is not None:
+        # vectorize/score chạy trên luồng gom batch; luồng request chỉ thấy thời gian chờ này
+        with telemetry.stage("batched_score"):
+            return content_batcher.submit(query_clean)
+    with telemetry.stage("vectorize"):
+        query_vec = vectorizer.transform([query_clean])
+    with telemetry.stage("score"):
+        cosine_sim = linear_kernel(query_vec, tfidf_matrix).flatten()
     return cosine_sim
 
+
+telemetry.register_cache("vector_search", cached_vector_search.cache_info)
+
 # =====================================
 # Hàm tìm kiếm thông minh
 # =====================================
-def smart_search(query, df=combined_df, top_n=10, min_score=0.0):
-    query_type = detect_query_type(query, df)
-    query_clean = clean_text_spacy(query)
-    print(f"🔍 Kiểu truy vấn phát hiện: {query_type}")
+# Cột sắp xếp (giảm dần) cho từng loại truy vấn dạng lọc
+FILTER_SORT_COLUMNS = {
+    "genre": ["vote_count", "rating", "popularity"],
+    "year": ["rating", "vote_count", "popularity"],
+    "person": ["rating", "vote_count", "popularity"],
+    "title": ["rating", "vote_count"],
+}
+
+
+def can_filter(query_type, query, df):
+    """Loại truy vấn này có chạy được nhánh lọc trên df không (ngược lại rơi xuống nhánh nội dung)."""
+    if query_type == "genre":
+        return "genre" in df.columns
+    if query_type == "year":
+        return "year" in df.columns and re.search(r"\b(19|20)\d{2}\b", query) is not None
+    return query_type in ("person", "title")
+
+
+def filter_rows(query_type, query, df):
+    """Vị trí dòng trong df khớp truy vấn genre/year/person/title, đã sắp xếp (chưa cắt top_n).
+
+    Chỉ đọc các cột lọc/sắp xếp — không dựng DataFrame con nào.
+    """
+    q = query.lower()
 
     # 1️⃣ Thể loại
-    if query_type == "genre" and "genre" in df.columns:
-        filtered = df[df["genre"].apply(lambda g: query.lower() in str(g).lower())]
-        if not filtered.empty:
-            sort_cols = [c for c in ["vote_count", "rating", "popularity"] if c in filtered.columns]
-            if sort_cols:
-                filtered = filtered.sort_values(by=sort_cols, ascending=False)
-            return filtered.head(top_n)
+    if query_type == "genre":
+        mask = df["genre"].apply(lambda g: q in str(g).lower())
 
     # 2️⃣ Năm
-    if query_type == "year" and "year" in df.columns:
-        year_match = re.search(r"\b(19|20)\d{2}\b", query)
-        if year_match:
-            year = int(year_match.group())
-            filtered = df[df["year"] == year]
-            sort_cols = [c for c in ["rating", "vote_count", "popularity"] if c in filtered.columns]
-            if sort_cols:
-                filtered = filtered.sort_values(by=sort_cols, ascending=False)
-            return filtered.head(top_n)
+    elif query_type == "year":
+        year = int(re.search(r"\b(19|20)\d{2}\b", query).group())
+        mask = df["year"] == year
 
     # 3️⃣ Người
-    if query_type == "person":
+    elif query_type == "person":
         mask = pd.Series(False, index=df.index)
         for col in ["cast", "director"]:
             if col in df.columns:
-                mask |= df[col].apply(lambda c: query.lower() in str(c).lower())
-        filtered = df[mask]
-        sort_cols = [c for c in ["rating", "vote_count", "popularity"] if c in filtered.columns]
-        if sort_cols:
-            filtered = filtered.sort_values(by=sort_cols, ascending=False)
-        return filtered.head(top_n)
+                mask |= df[col].apply(lambda c: q in str(c).lower())
 
     # 4️⃣ Tên phim
-    if query_type == "title":
-        filtered = df[df["title"].apply(lambda t: query.lower() in str(t).lower())]
-        if not filtered.empty:
-            sort_cols = [c for c in ["rating", "vote_count"] if c in filtered.columns]
-            if sort_cols:
-                filtered = filtered.sort_values(by=sort_cols, ascending=False)
-        return filtered.head(top_n)
-
-    # 5️⃣ Nội dung — TF-IDF Similarity (có cache)
-    cosine_sim = cached_vector_search(query_clean)
-    # Nếu top_n lớn hơn tổng số phim => lấy toàn bộ
-    if top_n >= len(cosine_sim):
-        top_sorted = np.argsort(cosine_sim)[::-1]  # sắp toàn bộ
     else:
-        top_indices = np.argpartition(cosine_sim, -top_n)[-top_n:]
-        top_sorted = top_indices[np.argsort(cosine_sim[top_indices])[::-1]]
+        mask = df["title"].apply(lambda t: q in str(t).lower())
+
+    rows = np.flatnonzero(mask.to_numpy(dtype=bool, na_value=False))
+    return sort_rows(rows, FILTER_SORT_COLUMNS[query_type], df)
+
+
+def sort_rows(rows, sort_cols, df):
+    """Sắp xếp giảm dần theo sort_cols, NaN xếp cuối, hòa thì giữ thứ tự gốc (như sort_values nhiều cột)."""
+    sort_cols = [c for c in sort_cols if c in df.columns]
+    if sort_cols and len(rows):
+        keys = []
+        for col in reversed(sort_cols):
+            values = df[col].to_numpy(dtype=float, na_value=np.nan)[rows]
+            keys.append(np.where(np.isnan(values), np.inf, -values))
+        rows = rows[np.lexsort(keys)]
+    return rows
+
+
+# =====================================
+# Điểm hợp nhất cho nhánh nội dung
+# =====================================
+# Trọng số của prior độ phổ biến trong điểm hợp nhất (phần còn lại cho cosine)
+POPULARITY_WEIGHT = float(os.environ.get("SEARCH_POPULARITY_WEIGHT", 0.3))
+SIMILARITY_WEIGHT = 1.0 - POPULARITY_WEIGHT
+
+
+def build_popularity_prior(df):
+    """vote_count chuẩn hóa min-max trên toàn catalog — tính một lần lúc load."""
+    if "vote_count" not in df.columns:
+        return None
+    vc = df["vote_count"].astype("float64").fillna(0).to_numpy()
+    return (vc - vc.min()) / (vc.max() - vc.min() + 1e-9)
 
-    results = df.iloc[top_sorted].copy()
-    results["similarity_score"] = cosine_sim[top_sorted]
 
-    if "vote_count" in results.columns:
-        vc = results["vote_count"].fillna(0).astype(float)
-        vc_norm = (vc - vc.min()) / (vc.max() - vc.min() + 1e-9)
-        results["combined_score"] = 0.7 * results["similarity_score"] + 0.3 * vc_norm
-        results = results.sort_values(by="combined_score", ascending=False)
+popularity_prior = build_popularity_prior(combined_df)
+
+
+def content_top_k(cosine_sim, top_n, min_score=0.0, offset=0):
+    """Chọn top_n theo SIMILARITY_WEIGHT * cosine + POPULARITY_WEIGHT * prior trên toàn bộ ứng viên (cosine > min_score).
+
+    Điểm hợp nhất được tính vector hóa trước khi chọn, bằng một lần argpartition,
+    nên thứ hạng không phụ thuộc top_n. offset là vị trí dòng đầu tiên của
+    cosine_sim trong catalog (dùng khi chấm điểm theo shard).
+    Trả về (rows, similarity, combined_score).
+    """
+    candidates = np.flatnonzero(cosine_sim > min_score)
+    similarity = cosine_sim[candidates]
+    rows = candidates + offset
+    if popularity_prior is None:
+        combined = similarity
     else:
-        results = results.sort_values(by="similarity_score", ascending=False)
+        combined = SIMILARITY_WEIGHT * similarity + POPULARITY_WEIGHT * popularity_prior[rows]
+    top = top_k_indices(combined, top_n)
+    return rows[top], similarity[top], combined[top]
+
+
+def content_results(rows, similarity, combined):
+    """Gói các dòng đã chọn (đã đúng thứ tự, không sort lại) cùng điểm của chúng."""
+    scores = {"similarity_score": similarity}
+    if popularity_prior is not None:
+        scores["combined_score"] = combined
+    return SearchResult(rows, "content", scores)
+
+
+# =====================================
+# Kết quả tìm kiếm gọn (materialize muộn)
+# =====================================
+class SearchResult:
+    """Vị trí dòng + các cột điểm song song; chỉ dựng dict phim cho trang được trả về."""
+
+    __slots__ = ("rows", "scores", "query_type", "explain")
+
+    def __init__(self, rows, query_type, scores=None, explain=None):
+        self.rows = np.asarray(rows, dtype=np.intp)
+        self.query_type = query_type
+        self.scores = {name: np.asarray(values) for name, values in (scores or {}).items()}
+        self.explain = explain  # kế hoạch truy vấn khi smart_search(explain=True)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def empty(self):
+        return len(self.rows) == 0
+
+    def slice(self, start, stop=None):
+        """Một trang kết quả — vẫn chỉ là mảng, chưa chạm tới dữ liệu phim."""
+        return SearchResult(
+            self.rows[start:stop],
+            self.query_type,
+            {name: values[start:stop] for name, values in self.scores.items()},
+        )
 
-    return results.head(top_n)
+    def materialize(self, columns=None):
+        """Dựng dict phim (chỉ với các cột yêu cầu) kèm các cột điểm."""
+        movies = materialize_movies(self.rows, columns)
+        for name, values in self.scores.items():
+            for movie, value in zip(movies, values.tolist()):
+                movie[name] = value
+        return movies
+
+
+def query_tokens(query_clean):
+    """Token của query sau làm sạch, kèm id trong từ vựng TF-IDF và IDF (None nếu ngoài từ vựng)."""
+    tokens = []
+    for token in vectorizer.build_analyzer()(query_clean):
+        vocab_id = vectorizer.vocabulary_.get(token)
+        tokens.append({
+            "token": token,
+            "vocab_id": None if vocab_id is None else int(vocab_id),
+            "idf": None if vocab_id is None else float(vectorizer.idf_[vocab_id]),
+        })
+    return tokens
+
+
+def smart_search(query, df=combined_df, top_n=10, min_score=0.0, explain=False):
+    """Tìm kiếm và trả về SearchResult (vị trí dòng trong df + điểm), chưa dựng dữ liệu phim.
+
+    explain=True gắn thêm result.explain: loại truy vấn + lý do, token (id từ vựng, IDF),
+    số ứng viên từng bước, cache hit/miss, cách chấm điểm và thời gian từng bước.
+    """
+    started = time.perf_counter()
+    plan = {"query": query} if explain else None
+
+    with telemetry.trace() as timings:
+        with telemetry.stage("detect_query_type"):
+            query_type, reason = explain_query_type(query, df)
+        with telemetry.stage("clean_text_spacy"):
+            query_clean = clean_text_spacy(query)
+        print(f"🔍 Kiểu truy vấn phát hiện: {query_type}")
+        if explain:
+            plan.update(query_type=query_type, reason=reason, tokens=query_tokens(query_clean), candidates={})
+
+        # 1️⃣–4️⃣ Thể loại / năm / người / tên phim (thể loại rỗng thì rơi xuống nhánh nội dung)
+        if query_type in FILTER_SORT_COLUMNS and can_filter(query_type, query, df):
+            with telemetry.stage("filter"):
+                rows = filter_rows(query_type, query, df)
+            if explain:
+                plan["candidates"]["filter_matches"] = len(rows)
+            if query_type != "genre" or len(rows):
+                result = SearchResult(rows[:top_n], query_type)
+                return _explained(result, plan, timings, started)
+            if explain:
+                plan["reason"] += "; no movie has this genre, fell back to content"
+
+        # 5️⃣ Nội dung — TF-IDF Similarity (có cache) + prior độ phổ biến
+        _vector_search_call.missed = False
+        with telemetry.stage("vector_search"):
+            cosine_sim = cached_vector_search(query_clean)
+        with telemetry.stage("select"):
+            rows, similarity, combined = content_top_k(cosine_sim, top_n, min_score)
+        if explain:
+            plan["candidates"]["nonzero_similarity"] = int(np.count_nonzero(cosine_sim))
+            plan["candidates"]["above_min_score"] = int(np.count_nonzero(cosine_sim > min_score))
+            plan["cache"] = "miss" if _vector_search_call.missed else "hit"
+            plan["scoring"] = "microbatch" if content_batcher is not None else "direct"
+        return _explained(content_results(rows, similarity, combined), plan, timings, started)
+
+
+def _explained(result, plan, timings, started):
+    if plan is not None:
+        plan["candidates"]["returned"] = len(result)
+        plan["timings_ms"] = {name: round(sec * 1000, 3) for name, sec in timings.items()}
+        plan["total_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        result.explain = plan
+    return result
 
+# =====================================
+# Tìm kiếm theo từng giai đoạn (cho SSE)
+# =====================================
+def build_title_index(df):
+    """Tên phim viết thường → các vị trí dòng, để tra trùng khớp tuyệt đối không cần quét."""
+    index = {}
+    for row, title in enumerate(df["title"].astype(str).str.lower().str.strip()):
+        index.setdefault(title, []).append(row)
+    return index
+
+
+title_index = build_title_index(combined_df)
+
+
+def search_stages(query, df=combined_df, top_n=10, min_score=0.0):
+    """Sinh (stage, SearchResult) từ nhanh đến chậm; kết quả cuối cùng giống hệt smart_search.
+
+    - "title":   trùng khớp tuyệt đối tên phim (tra dict, vài micro giây)
+    - "filter":  nhánh genre/year/person/title của smart_search (quét cột, không cần spaCy)
+    - "content": TF-IDF + prior độ phổ biến (làm sạch spaCy + nhân ma trận)
+    """
+    # 0️⃣ Trùng khớp tuyệt đối tên phim (chỉ với df gốc mà title_index mô tả)
+    if df is combined_df:
+        rows = np.asarray(title_index.get(query.lower().strip(), []), dtype=np.intp)
+        if len(rows):
+            yield "title", SearchResult(sort_rows(rows, FILTER_SORT_COLUMNS["title"], df)[:top_n], "title")
+
+    with telemetry.stage("detect_query_type"):
+        query_type = detect_query_type(query, df)
+
+    # 1️⃣–4️⃣ Thể loại / năm / người / tên phim
+    if query_type in FILTER_SORT_COLUMNS and can_filter(query_type, query, df):
+        with telemetry.stage("filter"):
+            rows = filter_rows(query_type, query, df)
+        if query_type != "genre" or len(rows):
+            yield "filter", SearchResult(rows[:top_n], query_type)
+            return
+
+    # 5️⃣ Nội dung
+    with telemetry.stage("clean_text_spacy"):
+        query_clean = clean_text_spacy(query)
+    cosine_sim = cached_vector_search(query_clean)
+    with telemetry.stage("select"):
+        rows, similarity, combined = content_top_k(cosine_sim, top_n, min_score)
+    yield "content", content_results(rows, similarity, combined)
+
+
+# =====================================
+# Kế toán bộ nhớ (cho /api/debug/memory)
+# =====================================
+def sparse_bytes(matrix):
+    return int(matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes)
+
+
+def container_bytes(obj):
+    """Ước lượng sâu cho dict/list/set gồm chuỗi, số và list số (đủ cho từ vựng & chỉ mục)."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        items = list(obj.keys()) + list(obj.values())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        items = obj
+    else:
+        return size
+    for item in items:
+        size += container_bytes(item) if isinstance(item, (dict, list, tuple, set, frozenset)) else sys.getsizeof(item)
+    return size
+
+
+def engine_memory():
+    """Số byte của từng cấu trúc dữ liệu trong engine: cột kho phục vụ, TF-IDF, từ vựng, cache, chỉ mục."""
+    column_bytes = combined_df.memory_usage(deep=True, index=False)
+    vocabulary = {
+        "terms": len(vectorizer.vocabulary_),
+        "vocabulary_bytes": container_bytes(vectorizer.vocabulary_),
+        "idf_bytes": int(vectorizer.idf_.nbytes),
+    }
+    if getattr(vectorizer, "stop_words_", None) is not None:
+        # Từ bị loại khi fit (max_df/min_df) — chỉ để tra cứu, có thể bỏ khi pickle
+        vocabulary["stop_words_bytes"] = container_bytes(vectorizer.stop_words_)
+
+    cache = cached_vector_search.cache_info()
+    return {
+        "movie_store": {
+            "rows": len(combined_df),
+            "columns": {col: int(n) for col, n in column_bytes.items()},
+            "total_bytes": int(column_bytes.sum()),
+        },
+        "tfidf_matrix": {
+            "shape": list(tfidf_matrix.shape),
+            "nnz": int(tfidf_matrix.nnz),
+            "data_bytes": int(tfidf_matrix.data.nbytes),
+            "indices_bytes": int(tfidf_matrix.indices.nbytes),
+            "indptr_bytes": int(tfidf_matrix.indptr.nbytes),
+            "total_bytes": sparse_bytes(tfidf_matrix),
+        },
+        "vectorizer": vocabulary,
+        "vector_search_cache": {
+            "entries": cache.currsize,
+            "maxsize": cache.maxsize,
+            # Mỗi mục là một mảng cosine float64 dài bằng số phim
+            "estimated_bytes": cache.currsize * len(combined_df) * np.dtype(np.float64).itemsize,
+        },
+        "indexes": {
+            "movie_id_index": int(movie_id_index.memory_usage(deep=True)),
+            "movie_rowids": int(movie_rowids.nbytes),
+            "popularity_prior": int(popularity_prior.nbytes) if popularity_prior is not None else 0,
+            "title_index": container_bytes(title_index),
+        },
+    }
+
+
+startup.checkpoint("engine_indexes")
 print("✅ Module smart_search() + cache đã sẵn sàng!")
\ No newline at end of file
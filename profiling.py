@@ -0,0 +1,101 @@
+# =====================================
+# profiling.py — Per-request profiling of live traffic (sampled stacks or cProfile)
+# =====================================
+
+import cProfile
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Profile requests carrying the PROFILE_HEADER header (value "sample" or "cprofile")
+PROFILE_ON_HEADER = os.environ.get("PROFILE_ON_HEADER", "0") == "1"
+PROFILE_HEADER = os.environ.get("PROFILE_HEADER", "X-Profile")
+# Also profile every Nth request of each worker; 0 turns sampling off
+PROFILE_SAMPLE_EVERY = int(os.environ.get("PROFILE_SAMPLE_EVERY", 0))
+# "sample": statistical stack sampler -> collapsed stacks (.folded, for flamegraph.pl /
+# speedscope); "cprofile": deterministic -> .pstats (for pstats / snakeviz)
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "sample")
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", 2))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+
+MODES = ("sample", "cprofile")
+
+_request_counter = itertools.count(1)
+_file_counter = itertools.count(1)
+
+
+def requested_mode(headers):
+    """Profiling mode for this request, or None to run it unprofiled"""
+    if PROFILE_ON_HEADER:
+        value = headers.get(PROFILE_HEADER)
+        if value:
+            return value if value in MODES else PROFILE_MODE
+    if PROFILE_SAMPLE_EVERY > 0 and next(_request_counter) % PROFILE_SAMPLE_EVERY == 0:
+        return PROFILE_MODE
+    return None
+
+
+class StackSampler:
+    """Sample one thread's Python stack every `interval` seconds from a helper thread"""
+
+    def __init__(self, thread_id, interval):
+        self._thread_id = thread_id
+        self._interval = interval
+        self._stop = threading.Event()
+        self.stacks = Counter()
+        self.samples = 0
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                return
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+
+def start(mode):
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()  # current thread only: the request thread
+        return mode, profiler
+    return mode, StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000).start()
+
+
+def stop(handle, label):
+    """Stop profiling and write the output file; returns its path"""
+    mode, profiler = handle
+    if mode == "cprofile":
+        profiler.disable()
+    else:
+        profiler.stop()
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_label = "".join(c if c.isalnum() else "_" for c in label).strip("_") or "root"
+    base = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_file_counter)}-{safe_label}")
+    if mode == "cprofile":
+        path = base + ".pstats"
+        profiler.dump_stats(path)
+    else:
+        path = base + ".folded"
+        with open(path, "w") as f:
+            for stack, count in profiler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+    return path
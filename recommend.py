@@ -0,0 +1,306 @@
+# =====================================
+# recommend.py — Personalized recommendations from a user's favorites
+# =====================================
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+from sklearn.preprocessing import normalize
+
+import telemetry
+from process import tfidf_matrix, movie_id_index, top_k_indices
+
+# Only titles the user actually watched shape the profile
+STATUS_WEIGHTS = {"completed": 1.0, "watching": 0.6}
+RECENCY_HALF_LIFE_DAYS = 180
+
+PROFILE_CACHE_SIZE = 1024
+PROFILE_CACHE_TTL = 300  # seconds; bounds staleness across gunicorn workers
+
+_profile_cache = OrderedDict()
+_profile_lock = threading.Lock()
+# Bumped by invalidate_profile; a profile built across a bump is not cached
+_profile_generations = {}
+
+
+def _recency_weight(updated_at, now):
+    """Exponential decay by age of the favorite, halving every RECENCY_HALF_LIFE_DAYS"""
+    try:
+        updated = datetime.strptime(str(updated_at)[:19], "%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return 1.0
+    age_days = max(0.0, (now - updated).total_seconds() / 86400)
+    return 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+
+
+def build_profile(favorites):
+    """Build (profile_vector, seen_rows) from favorite rows (movie_id, status, updated_at).
+
+    The profile is the L2-normalized, weighted sum of the tfidf_matrix rows of
+    completed/watching titles. seen_rows holds every favorited movie so it can be
+    excluded from the recommendations.
+    """
+    movie_ids = [fav["movie_id"] for fav in favorites]
+    rows = movie_id_index.get_indexer(movie_ids)
+    seen_rows = rows[rows >= 0]
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    profile_rows, weights = [], []
+    for fav, row in zip(favorites, rows):
+        status_weight = STATUS_WEIGHTS.get(fav["status"])
+        if row < 0 or not status_weight:
+            continue
+        profile_rows.append(row)
+        weights.append(status_weight * _recency_weight(fav["updated_at"], now))
+
+    if not profile_rows:
+        return None, seen_rows
+
+    profile = csr_matrix(np.asarray([weights])).dot(tfidf_matrix[profile_rows])
+    return normalize(profile), seen_rows
+
+
+def get_profile(user_id, load_favorites):
+    """Return the cached profile for user_id, rebuilding it via load_favorites() on a miss"""
+    now = time.monotonic()
+    with _profile_lock:
+        entry = _profile_cache.get(user_id)
+        if entry is not None and now - entry[0] < PROFILE_CACHE_TTL:
+            _profile_cache.move_to_end(user_id)
+            telemetry.inc("cache_hits_total", cache="profile")
+            return entry[1], entry[2]
+        generation = _profile_generations.get(user_id, 0)
+    telemetry.inc("cache_misses_total", cache="profile")
+
+    profile, seen_rows = build_profile(load_favorites())
+
+    with _profile_lock:
+        if _profile_generations.get(user_id, 0) != generation:
+            # The favorites changed while this profile was built: serve it once, don't cache it
+            return profile, seen_rows
+        _profile_cache[user_id] = (now, profile, seen_rows)
+        _profile_cache.move_to_end(user_id)
+        while len(_profile_cache) > PROFILE_CACHE_SIZE:
+            _profile_cache.popitem(last=False)
+    return profile, seen_rows
+
+
+def invalidate_profile(user_id):
+    """Drop the cached profile after the user's favorites change"""
+    with _profile_lock:
+        _profile_cache.pop(user_id, None)
+        _profile_generations[user_id] = _profile_generations.get(user_id, 0) + 1
+
+
+def profile_cache_memory():
+    """Entries and bytes held by the profile cache"""
+    with _profile_lock:
+        entries = list(_profile_cache.values())
+    total = 0
+    for _, profile, seen_rows in entries:
+        total += seen_rows.nbytes
+        if profile is not None:
+            total += profile.data.nbytes + profile.indices.nbytes + profile.indptr.nbytes
+    return {"entries": len(entries), "maxsize": PROFILE_CACHE_SIZE, "bytes": int(total)}
+
+
+def recommend_for_user(user_id, load_favorites, top_n=20):
+    """Return (row_positions, scores) of the best unseen matches for the user's profile"""
+    profile, seen_rows = get_profile(user_id, load_favorites)
+    if profile is None:
+        return np.empty(0, dtype=np.intp), np.empty(0)
+
+    scores = tfidf_matrix.dot(profile.T).toarray().ravel()
+    top = top_k_indices(scores, top_n, exclude=seen_rows)
+    top = top[scores[top] > 0]
+    return top, scores[top]
+
+
+# =====================================
+# Item co-occurrence ("people who saved X also saved Y")
+# =====================================
+COSAVE_REBUILD_INTERVAL = 600  # seconds between full rebuilds from the favorites table
+COSAVE_COMPACT_THRESHOLD = 5000  # pending delta cells before folding them into the CSR
+_refresher_init_lock = threading.Lock()
+
+
+class CoSaveIndex:
+    """Sparse item-item co-occurrence counts over favorites(user_id, movie_id).
+
+    Counts are kept as an int32 CSR matrix indexed by catalog row. The favorites
+    routes feed incremental +1/-1 updates into a small per-row delta map that is
+    folded into the CSR once it grows past COSAVE_COMPACT_THRESHOLD. A background
+    thread per process rebuilds from the table every rebuild_interval seconds to
+    pick up writes handled by other workers and reconcile any drift; requests
+    never scan the table themselves.
+
+    Routes must commit a favorites change and record it inside `commit_lock`.
+    The rebuild reads the table under the same lock, so every change is either
+    in the rows it reads or in the journal of deltas replayed after the swap,
+    never both and never neither.
+    """
+
+    def __init__(self, load_pairs, n_items=None,
+                 rebuild_interval=COSAVE_REBUILD_INTERVAL,
+                 compact_threshold=COSAVE_COMPACT_THRESHOLD):
+        self._load_pairs = load_pairs
+        self._n = n_items if n_items is not None else len(movie_id_index)
+        self._rebuild_interval = rebuild_interval
+        self._compact_threshold = compact_threshold
+        self._matrix = csr_matrix((self._n, self._n), dtype=np.int32)
+        self._deltas = {}
+        self._pending = 0
+        self._journal = None  # deltas recorded while a rebuild is in progress
+        self._built_at = None
+        self._lock = threading.RLock()
+        self._rebuild_lock = threading.Lock()
+        self.commit_lock = threading.Lock()
+        self._refresher_pid = None
+
+    def rebuild(self):
+        """Recount co-occurrences from all (user_id, movie_id) pairs"""
+        with self._rebuild_lock:
+            with self.commit_lock:
+                pairs = self._load_pairs()
+                with self._lock:
+                    self._journal = []
+            try:
+                matrix = self._count(pairs)
+            except BaseException:
+                with self._lock:
+                    self._journal = None
+                raise
+
+            with self._lock:
+                journal, self._journal = self._journal, None
+                self._matrix = matrix
+                self._deltas = {}
+                self._pending = 0
+                for row, others, delta in journal:
+                    self._apply(row, others, delta)
+                self._built_at = time.monotonic()
+
+    def _count(self, pairs):
+        user_ids = np.asarray([p[0] for p in pairs])
+        rows = movie_id_index.get_indexer([p[1] for p in pairs])
+        keep = rows >= 0
+        users, user_codes = np.unique(user_ids[keep], return_inverse=True)
+        saved = csr_matrix(
+            (np.ones(keep.sum(), dtype=np.int32), (user_codes, rows[keep])),
+            shape=(len(users), self._n),
+        )
+        matrix = saved.T.dot(saved).tocsr()
+        matrix = (matrix - diags(matrix.diagonal())).tocsr()
+        matrix.eliminate_zeros()
+        return matrix.astype(np.int32)
+
+    def _ensure_refresher(self):
+        # Threads don't survive fork (gunicorn preload): each process starts its own
+        if self._refresher_pid == os.getpid():
+            return
+        with _refresher_init_lock:
+            if self._refresher_pid == os.getpid():
+                return
+            self._refresher_pid = os.getpid()
+            threading.Thread(target=self._refresh_loop, name="cosave-rebuild", daemon=True).start()
+
+    def _refresh_loop(self):
+        while True:
+            if self._built_at is not None:
+                time.sleep(max(0.0, self._built_at + self._rebuild_interval - time.monotonic()))
+            try:
+                self.rebuild()
+            except Exception as e:
+                # Keep serving the current counts; try again next interval
+                print(f"⚠️ Co-save index rebuild failed: {e}")
+                time.sleep(self._rebuild_interval)
+
+    def _record(self, movie_id, other_movie_ids, delta):
+        row = movie_id_index.get_indexer([movie_id])[0]
+        others = movie_id_index.get_indexer(list(other_movie_ids))
+        others = others[(others >= 0) & (others != row)]
+        if row < 0 or not len(others):
+            return
+        self._ensure_refresher()
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((row, others, delta))
+            self._apply(row, others, delta)
+            if self._pending >= self._compact_threshold:
+                self.compact()
+
+    def _apply(self, row, others, delta):
+        for other in others.tolist():
+            for a, b in ((row, other), (other, row)):
+                cells = self._deltas.setdefault(a, {})
+                cells[b] = cells.get(b, 0) + delta
+        self._pending += 2 * len(others)
+
+    def memory(self):
+        """Bytes of the CSR counts plus an estimate for the pending delta map"""
+        with self._lock:
+            matrix = self._matrix
+            delta_cells = sum(len(cells) for cells in self._deltas.values())
+        return {
+            "nnz": int(matrix.nnz),
+            "matrix_bytes": int(matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes),
+            "delta_cells": delta_cells,
+            # ~ one dict slot + two small ints per cell, plus one dict per row
+            "estimated_delta_bytes": delta_cells * 100 + len(self._deltas) * 250,
+        }
+
+    def record_add(self, movie_id, other_movie_ids):
+        """A user saved movie_id while already having other_movie_ids saved"""
+        self._record(movie_id, other_movie_ids, 1)
+
+    def record_remove(self, movie_id, other_movie_ids):
+        """A user removed movie_id; other_movie_ids are the titles they still have saved"""
+        self._record(movie_id, other_movie_ids, -1)
+
+    def compact(self):
+        """Fold the pending deltas into the CSR matrix"""
+        with self._lock:
+            if not self._deltas:
+                return
+            rows, cols, data = [], [], []
+            for row, cells in self._deltas.items():
+                for col, delta in cells.items():
+                    rows.append(row)
+                    cols.append(col)
+                    data.append(delta)
+            delta_matrix = csr_matrix((data, (rows, cols)), shape=(self._n, self._n), dtype=np.int32)
+            matrix = (self._matrix + delta_matrix).tocsr()
+            matrix.data[matrix.data < 0] = 0
+            matrix.eliminate_zeros()
+            self._matrix = matrix
+            self._deltas = {}
+            self._pending = 0
+
+    def top_k(self, movie_id, k=12):
+        """Return (row_positions, counts) of the movies most often saved together with movie_id"""
+        row = movie_id_index.get_indexer([movie_id])[0]
+        if row < 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.int64)
+        self._ensure_refresher()
+
+        with self._lock:
+            start, end = self._matrix.indptr[row], self._matrix.indptr[row + 1]
+            cols = self._matrix.indices[start:end].astype(np.intp)
+            counts = self._matrix.data[start:end].astype(np.int64)
+            cells = self._deltas.get(row)
+            if cells:
+                merged = dict(zip(cols.tolist(), counts.tolist()))
+                for col, delta in cells.items():
+                    merged[col] = merged.get(col, 0) + delta
+                cols = np.fromiter(merged.keys(), dtype=np.intp, count=len(merged))
+                counts = np.fromiter(merged.values(), dtype=np.int64, count=len(merged))
+
+        keep = counts > 0
+        cols, counts = cols[keep], counts[keep]
+        top = top_k_indices(counts, k)
+        return cols[top], counts[top]
@@ -0,0 +1,108 @@
+# =====================================
+# search_executor.py — Pool of warm engine processes for CPU-bound search
+# =====================================
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import telemetry
+from process import smart_search, combined_df
+from shards import sharded_search
+
+# 0 runs smart_search inline on the request thread (the old behaviour)
+SEARCH_POOL_WORKERS = int(os.environ.get("SEARCH_POOL_WORKERS", 0))
+SEARCH_POOL_TIMEOUT = float(os.environ.get("SEARCH_POOL_TIMEOUT", 30))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_served = threading.local()
+
+
+def _warm_up():
+    """Run once in each pool process so the first real query doesn't pay for lazy init"""
+    smart_search("warm up", df=combined_df, top_n=1)
+
+
+def _search_rows(query, top_n, explain=False):
+    """Executed in a pool process: a SearchResult is only row positions and score arrays.
+
+    The stage timings go back with it, since the caller's trace can't see this process.
+    """
+    with telemetry.trace() as timings:
+        result = smart_search(query, df=combined_df, top_n=top_n, explain=explain)
+    return result, timings
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        # A pool inherited through fork (e.g. gunicorn preload) is unusable in the child
+        if _pool is None or _pool_pid != os.getpid():
+            # fork shares the already-loaded engine copy-on-write; spawn would reload it
+            method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(
+                max_workers=SEARCH_POOL_WORKERS,
+                mp_context=multiprocessing.get_context(method),
+                initializer=_warm_up,
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def engine():
+    """Which path search() takes with the current configuration"""
+    if sharded_search is not None:
+        return "shards"
+    return "pool" if SEARCH_POOL_WORKERS > 0 else "inline"
+
+
+def search(query, top_n=10, explain=False):
+    """Run smart_search — across the shard processes when SEARCH_SHARDS > 0, else in
+    the process pool when SEARCH_POOL_WORKERS > 0, else inline.
+
+    Returns the same SearchResult as calling smart_search inline; only row
+    positions and scores cross the pipe. With explain=True the plan is built by
+    whichever engine served the query and names it in plan["engine"].
+    """
+    if sharded_search is not None:
+        return _tag(sharded_search.search(query, top_n=top_n, explain=explain), "shards")
+    if SEARCH_POOL_WORKERS <= 0:
+        return _tag(smart_search(query, df=combined_df, top_n=top_n, explain=explain), "inline")
+
+    try:
+        with telemetry.stage("search_pool"):
+            result, timings = _get_pool().submit(_search_rows, query, top_n, explain).result(timeout=SEARCH_POOL_TIMEOUT)
+        telemetry.add_stages(timings)
+        return _tag(result, "pool")
+    except BrokenProcessPool:
+        # A pool process died (OOM kill, segfault): rebuild and answer this one inline
+        _reset_pool()
+        return _tag(smart_search(query, df=combined_df, top_n=top_n, explain=explain), "inline")
+
+
+def _tag(result, engine_name):
+    _served.engine = engine_name
+    if result is not None and result.explain is not None:
+        result.explain["engine"] = engine_name
+    return result
+
+
+def served_engine():
+    """Engine that answered this thread's last search() (differs from engine() after a pool fallback)"""
+    return getattr(_served, "engine", None)
+
+
+def shutdown():
+    _reset_pool()
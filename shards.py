@@ -0,0 +1,310 @@
+# =====================================
+# shards.py — Scatter-gather search across local shard processes
+# =====================================
+
+import heapq
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from itertools import islice
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.metrics.pairwise import linear_kernel
+
+import telemetry
+from process import (
+    combined_df, tfidf_matrix, vectorizer, clean_text_spacy, explain_query_type, query_tokens,
+    FILTER_SORT_COLUMNS, can_filter, filter_rows, content_top_k, content_results, SearchResult,
+)
+
+# 0 disables sharding; K > 0 splits the catalog rows across K shard processes
+SEARCH_SHARDS = int(os.environ.get("SEARCH_SHARDS", 0))
+SHARD_TIMEOUT = float(os.environ.get("SEARCH_SHARD_TIMEOUT", 30))
+
+
+def _row_slice(matrix, lo, hi):
+    """Rows lo:hi of a CSR matrix sharing data/indices with the parent (no copy)"""
+    start, end = matrix.indptr[lo], matrix.indptr[hi]
+    return csr_matrix(
+        (matrix.data[start:end], matrix.indices[start:end], matrix.indptr[lo:hi + 1] - start),
+        shape=(hi - lo, matrix.shape[1]),
+    )
+
+
+def _sort_key(values, row):
+    # NaN sorts last like pandas; -row keeps the original order among ties
+    return tuple(-np.inf if v != v else float(v) for v in values) + (-row,)
+
+
+def _partial_filter(df, lo, query_type, query, top_n):
+    matches = filter_rows(query_type, query, df)
+    local = matches[:top_n]
+    sort_cols = [c for c in FILTER_SORT_COLUMNS[query_type] if c in df.columns]
+    values = (df[sort_cols].iloc[local].astype(float).to_numpy() if sort_cols
+              else np.empty((len(local), 0)))
+    rows = local + lo
+    return [(_sort_key(v, int(r)), int(r)) for v, r in zip(values, rows)], {"filter_matches": len(matches)}
+
+
+def _partial_content(matrix, lo, query_vec, top_n, min_score):
+    cosine_sim = linear_kernel(query_vec, matrix).ravel()
+    rows, similarity, combined = content_top_k(cosine_sim, top_n, min_score, offset=lo)
+    counts = {
+        "nonzero_similarity": int(np.count_nonzero(cosine_sim)),
+        "above_min_score": int(np.count_nonzero(cosine_sim > min_score)),
+    }
+    return [((float(c), -int(r)), int(r), float(s)) for r, s, c in zip(rows, similarity, combined)], counts
+
+
+def _shard_main(conn, lo, hi):
+    """Shard process loop: answer partial top-k requests for rows lo:hi"""
+    matrix = _row_slice(tfidf_matrix, lo, hi)
+    df = combined_df.iloc[lo:hi]
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        req_id, kind, args, top_n = message
+        started = time.perf_counter()
+        try:
+            if kind == "content":
+                partial = _partial_content(matrix, lo, args[0], top_n, args[1])
+            else:
+                partial = _partial_filter(df, lo, args[0], args[1], top_n)
+            conn.send((req_id, partial, time.perf_counter() - started, None))
+        except Exception as e:
+            conn.send((req_id, None, time.perf_counter() - started, repr(e)))
+
+
+class ShardedSearch:
+    """Coordinator for K shard processes, each owning a contiguous slice of catalog rows.
+
+    Every query is sent to all shards, each returns its partial top-k as
+    (sort_key, row, ...) tuples sorted descending, and the coordinator merges
+    them with a heap. Content keys are the fused score from content_top_k,
+    which only depends on each row, so the merge is exact.
+    """
+
+    def __init__(self, n_shards):
+        self.n_shards = n_shards
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._conns, self._procs, self._send_locks = [], [], []
+        self._pending = {}
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid() and all(p.is_alive() for p in self._procs):
+                return
+            # A shard died, or the shards belong to the process we forked from: retire the old set
+            self._stop_shards(own=self._pid == os.getpid())
+            ctx = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+            bounds = np.linspace(0, len(combined_df), self.n_shards + 1).astype(int)
+            conns, procs, send_locks = [], [], []
+            pending = {}
+            self._req_ids = itertools.count()
+            self._latencies = [deque(maxlen=1024) for _ in range(self.n_shards)]
+            self._spreads = deque(maxlen=1024)
+            self._requests = 0
+            for shard, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+                parent_conn, child_conn = ctx.Pipe()
+                proc = ctx.Process(target=_shard_main, args=(child_conn, int(lo), int(hi)),
+                                   name=f"search-shard-{shard}", daemon=True)
+                proc.start()
+                child_conn.close()
+                conns.append(parent_conn)
+                procs.append(proc)
+                send_locks.append(threading.Lock())
+            with self._pending_lock:
+                self._conns, self._procs, self._send_locks, self._pending = conns, procs, send_locks, pending
+            for shard, conn in enumerate(conns):
+                threading.Thread(target=self._receive, args=(shard, conn, pending),
+                                 name=f"search-shard-{shard}-recv", daemon=True).start()
+            self._bounds = bounds
+            self._pid = os.getpid()
+
+    def _stop_shards(self, own):
+        """Close the current pipes; stop and reap the shard processes if this process started them"""
+        for conn, lock in zip(self._conns, self._send_locks):
+            with lock:
+                if not own:
+                    conn.close()  # no receive thread survived the fork to close it
+                    continue
+                try:
+                    conn.send(None)
+                except OSError:
+                    pass
+        if own:
+            # Each receive thread sees EOF once its shard exits, then closes its pipe
+            for proc in self._procs:
+                proc.join(timeout=1)
+                if proc.is_alive():
+                    proc.terminate()
+                    proc.join(timeout=1)
+        self._conns, self._procs, self._send_locks = [], [], []
+
+    def _receive(self, shard, conn, pending):
+        """Route one shard's replies to the futures in `pending`, the request map of its own generation.
+
+        Exits when the shard does, or once _start has retired this pipe.
+        """
+        while True:
+            try:
+                req_id, partial, elapsed, error = conn.recv()
+            except (EOFError, OSError):
+                return self._retire(shard, conn, pending, f"search shard {shard} exited")
+            with self._pending_lock:
+                retired = shard >= len(self._conns) or self._conns[shard] is not conn
+                futures = pending.get(req_id)
+            if retired:
+                return self._retire(shard, conn, pending, f"search shard {shard} was restarted")
+            if futures is None:
+                continue
+            self._latencies[shard].append(elapsed)
+            if error:
+                futures[shard].set_exception(RuntimeError(f"search shard {shard}: {error}"))
+            else:
+                futures[shard].set_result((partial, elapsed))
+
+    def _retire(self, shard, conn, pending, error):
+        conn.close()
+        with self._pending_lock:
+            futures = [fs[shard] for fs in pending.values()]
+        for future in futures:
+            if not future.done():
+                future.set_exception(RuntimeError(error))
+
+    def _scatter(self, kind, args, top_n):
+        """Send one request to every shard; ([partial per shard], summed candidate counts, [seconds per shard])"""
+        req_id = next(self._req_ids)
+        futures = [Future() for _ in range(self.n_shards)]
+        with self._pending_lock:
+            conns, send_locks, pending = self._conns, self._send_locks, self._pending
+            pending[req_id] = futures
+        try:
+            for conn, lock in zip(conns, send_locks):
+                with lock:
+                    conn.send((req_id, kind, args, top_n))
+            results = [f.result(timeout=SHARD_TIMEOUT) for f in futures]
+        finally:
+            with self._pending_lock:
+                pending.pop(req_id, None)
+
+        elapsed = [e for _, e in results]
+        with self._pending_lock:
+            self._requests += 1
+        self._spreads.append(max(elapsed) - min(elapsed))
+        counts = {}
+        for (_, shard_counts), _ in results:
+            for name, n in shard_counts.items():
+                counts[name] = counts.get(name, 0) + n
+        return [partial for (partial, _), _ in results], counts, elapsed
+
+    @staticmethod
+    def _merge(partials, top_n):
+        """k-way heap merge of the per-shard lists, each already sorted descending"""
+        return list(islice(heapq.merge(*partials, reverse=True), top_n))
+
+    def search(self, query, top_n=10, min_score=0.0, explain=False):
+        """Same contract as smart_search over combined_df, scored across the shards.
+
+        Detection, cleaning and vectorizing run here, on the caller's thread, as
+        telemetry stages; the shards' share is the shard_filter / shard_score stage
+        (scatter, wait for the slowest shard, merge).
+        """
+        self._start()
+        started = time.perf_counter()
+        with telemetry.trace() as timings:
+            with telemetry.stage("detect_query_type"):
+                query_type, reason = explain_query_type(query, combined_df)
+            query_clean = None
+            if explain:
+                # The filter branch never needs the cleaned query; only the plan does
+                with telemetry.stage("clean_text_spacy"):
+                    query_clean = clean_text_spacy(query)
+                plan = {"query": query, "query_type": query_type, "reason": reason,
+                        "tokens": query_tokens(query_clean), "candidates": {}}
+            else:
+                plan = None
+
+            if query_type in FILTER_SORT_COLUMNS and can_filter(query_type, query, combined_df):
+                with telemetry.stage("shard_filter"):
+                    partials, counts, shard_elapsed = self._scatter("filter", (query_type, query), top_n)
+                    merged = self._merge(partials, top_n)
+                rows = [row for _, row in merged]
+                if explain:
+                    plan["candidates"].update(counts)
+                if query_type != "genre" or rows:
+                    return self._explained(SearchResult(rows, query_type), plan, shard_elapsed, timings, started)
+                if explain:
+                    plan["reason"] += "; no movie has this genre, fell back to content"
+
+            if query_clean is None:
+                with telemetry.stage("clean_text_spacy"):
+                    query_clean = clean_text_spacy(query)
+            with telemetry.stage("vectorize"):
+                query_vec = vectorizer.transform([query_clean])
+            with telemetry.stage("shard_score"):
+                partials, counts, shard_elapsed = self._scatter("content", (query_vec, min_score), top_n)
+                merged = self._merge(partials, top_n)
+            rows = np.asarray([row for _, row, _ in merged], dtype=np.intp)
+            similarity = np.asarray([sim for _, _, sim in merged])
+            combined = np.asarray([key[0] for key, _, _ in merged])
+            if explain:
+                plan["candidates"].update(counts)
+                # Each shard scores its own slice; nothing goes through cached_vector_search
+                plan["cache"] = "none"
+            return self._explained(content_results(rows, similarity, combined), plan, shard_elapsed, timings, started)
+
+    @staticmethod
+    def _explained(result, plan, shard_elapsed, timings, started):
+        if plan is not None:
+            plan["candidates"]["returned"] = len(result)
+            plan["scoring"] = "shards"
+            plan["shard_ms"] = [round(e * 1000, 3) for e in shard_elapsed]
+            plan["timings_ms"] = {name: round(sec * 1000, 3) for name, sec in timings.items()}
+            plan["total_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            result.explain = plan
+        return result
+
+    def stats(self):
+        """Per-shard latency and the max-min spread across shards per request, in ms"""
+        if self._pid != os.getpid():
+            return {"shards": self.n_shards, "requests": 0}
+
+        def summary(values):
+            arr = np.asarray(values) * 1000
+            if not len(arr):
+                return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+            return {
+                "mean": float(arr.mean()),
+                "p50": float(np.percentile(arr, 50)),
+                "p95": float(np.percentile(arr, 95)),
+                "max": float(arr.max()),
+            }
+
+        return {
+            "shards": self.n_shards,
+            "requests": self._requests,
+            "rows_per_shard": np.diff(self._bounds).tolist(),
+            "shard_latency_ms": [summary(lat) for lat in self._latencies],
+            "spread_ms": summary(self._spreads),
+        }
+
+    def close(self):
+        if self._pid != os.getpid():
+            return
+        with self._start_lock:
+            self._stop_shards(own=True)
+            self._pid = None
+
+sharded_search = ShardedSearch(SEARCH_SHARDS) if SEARCH_SHARDS > 0 else None
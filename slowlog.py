@@ -0,0 +1,80 @@
+# =====================================
+# slowlog.py — JSON-lines slow-query log written off the request path
+# =====================================
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+# Requests slower than this are logged; <= 0 turns the log off
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 500))
+# "{pid}" in the path gives each worker its own file: RotatingFileHandler doesn't
+# coordinate rotation between processes appending to the same file. Keep it in
+# any override used with more than one worker.
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG", "logs/slow_queries-{pid}.jsonl")
+SLOW_QUERY_LOG_BYTES = int(os.environ.get("SLOW_QUERY_LOG_BYTES", 10 * 2**20))
+SLOW_QUERY_LOG_BACKUPS = int(os.environ.get("SLOW_QUERY_LOG_BACKUPS", 5))
+
+logger = logging.getLogger("movie_query.slow_queries")
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+_listener = None
+_listener_pid = None
+_init_lock = threading.Lock()
+
+
+def _start():
+    """Per process: the request thread only enqueues; a listener thread does the file I/O"""
+    global _listener, _listener_pid
+    with _init_lock:
+        if _listener_pid == os.getpid():
+            return
+        path = SLOW_QUERY_LOG.format(pid=os.getpid())
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=SLOW_QUERY_LOG_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8"
+        )
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+
+        # A handler inherited through fork belongs to the parent's (dead here) listener
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        records = queue.SimpleQueue()
+        logger.addHandler(logging.handlers.QueueHandler(records))
+        _listener = logging.handlers.QueueListener(records, file_handler)
+        _listener.start()
+        _listener_pid = os.getpid()
+        # The listener thread is a daemon: flush what is still queued when the worker exits
+        atexit.register(stop)
+
+
+def record(endpoint, elapsed, stages=None, **fields):
+    """Log one request if it took at least SLOW_QUERY_MS; never blocks on disk"""
+    if SLOW_QUERY_MS <= 0 or elapsed * 1000 < SLOW_QUERY_MS:
+        return
+    if _listener_pid != os.getpid():
+        _start()
+    entry = {
+        "ts": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "endpoint": endpoint,
+        "duration_ms": round(elapsed * 1000, 3),
+        **fields,
+        "stages_ms": {name: round(sec * 1000, 3) for name, sec in (stages or {}).items()},
+        "pid": os.getpid(),
+    }
+    logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+def stop():
+    """Flush what is queued (at exit / in tests)"""
+    global _listener_pid
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+        _listener_pid = None
@@ -0,0 +1,59 @@
+# =====================================
+# startup.py — Cold-start breakdown: wall time and RSS growth per phase
+# =====================================
+# Import this first; every checkpoint() closes the phase that started at the
+# previous one, so phases follow import order with no gaps.
+
+import json
+import os
+import sys
+import time
+
+from memstats import process_memory
+
+# "" = off, "-" = print a table to stdout, anything else = path of a JSON report
+STARTUP_REPORT = os.environ.get("STARTUP_REPORT", "")
+
+_started = time.perf_counter()
+_last_time = _started
+_last_rss = process_memory()["rss"]
+phases = []
+
+
+def checkpoint(name):
+    """Record the phase `name` as everything since the previous checkpoint"""
+    global _last_time, _last_rss
+    now = time.perf_counter()
+    rss = process_memory()["rss"]
+    phases.append({
+        "phase": name,
+        "seconds": round(now - _last_time, 4),
+        "rss_delta_mb": round((rss - _last_rss) / 2**20, 1),
+        "rss_mb": round(rss / 2**20, 1),
+    })
+    _last_time, _last_rss = now, rss
+
+
+def summary():
+    return {
+        "total_seconds": round(_last_time - _started, 4),
+        "rss_mb": phases[-1]["rss_mb"] if phases else None,
+        "pid": os.getpid(),
+        "python": sys.version.split()[0],
+        "phases": phases,
+    }
+
+
+def report():
+    """Print or write the report as configured by STARTUP_REPORT"""
+    if not STARTUP_REPORT:
+        return
+    data = summary()
+    if STARTUP_REPORT != "-":
+        with open(STARTUP_REPORT, "w") as f:
+            json.dump(data, f, indent=2)
+        return
+    print(f"{'phase':<24}{'seconds':>9}{'RSS +MB':>10}{'RSS MB':>9}")
+    for p in phases:
+        print(f"{p['phase']:<24}{p['seconds']:>9.3f}{p['rss_delta_mb']:>10.1f}{p['rss_mb']:>9.1f}")
+    print(f"{'total':<24}{data['total_seconds']:>9.3f}{'':>10}{data['rss_mb']:>9.1f}")
@@ -0,0 +1,302 @@
+# =====================================
+# telemetry.py — Stage timers, latency histograms and Prometheus export
+# =====================================
+
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Directory shared by all gunicorn workers (and their pool/shard processes); each
+# process writes its own snapshot there and /api/metrics sums them. Unset keeps
+# metrics per process; gunicorn.conf.py defaults it to metrics/.
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", 5))
+METRIC_PREFIX = "movie_"
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "search_stage_seconds": "Time spent in each search engine stage",
+    "http_request_seconds": "Request latency by endpoint",
+    "http_requests_total": "Requests by endpoint and status code",
+    "cache_hits_total": "Cache hits by cache",
+    "cache_misses_total": "Cache misses by cache",
+    "cache_hit_ratio": "hits / (hits + misses) by cache",
+    "metrics_processes": "Processes whose snapshots were aggregated",
+}
+
+_init_lock = threading.Lock()
+
+
+class _Registry:
+    """Histograms and counters for the current process; state resets after fork"""
+
+    def __init__(self):
+        self._pid = None
+        self._sources = []
+
+    def _ensure(self):
+        if self._pid == os.getpid():
+            return
+        with _init_lock:
+            if self._pid == os.getpid():
+                return
+            self._lock = threading.Lock()
+            self._histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+            self._counters = {}    # (name, labels) -> value
+            self._pid = os.getpid()
+            if METRICS_DIR:
+                threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True).start()
+
+    def observe(self, name, seconds, labels):
+        self._ensure()
+        key = (name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    hist[i] += 1
+                    break
+            else:
+                hist[len(LATENCY_BUCKETS)] += 1
+            hist[-1] += seconds
+
+    def inc(self, name, amount, labels):
+        self._ensure()
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def add_source(self, source):
+        self._sources.append(source)
+
+    def snapshot(self):
+        """This process's metrics as JSON-friendly lists"""
+        self._ensure()
+        with self._lock:
+            histograms = [[name, list(labels), list(hist)] for (name, labels), hist in self._histograms.items()]
+            counters = [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+        # Sources report cumulative per-process totals (e.g. lru_cache.cache_info())
+        for source in self._sources:
+            counters += [[name, sorted(labels.items()), value] for name, labels, value in source()]
+        return {"pid": os.getpid(), "histograms": histograms, "counters": counters}
+
+    def flush(self):
+        if not METRICS_DIR:
+            return
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f"metrics-{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + ".tmp", path)
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(METRICS_FLUSH_SECONDS)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+
+_registry = _Registry()
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def observe(name, seconds, **labels):
+    """Record one duration (seconds) in the histogram `name`"""
+    _registry.observe(name, seconds, _labels(labels))
+
+
+def inc(name, amount=1, **labels):
+    _registry.inc(name, amount, _labels(labels))
+
+
+@contextmanager
+def timer(name, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+_local = threading.local()
+
+
+@contextmanager
+def stage(name):
+    """Time one search engine stage: `with telemetry.stage("score"): ...`
+
+    Besides the histogram, the duration is added to every trace() open on this thread.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        observe("search_stage_seconds", elapsed, stage=name)
+        for timings in getattr(_local, "traces", ()):
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+def add_stages(timings):
+    """Add {stage: seconds} measured off this thread (e.g. in a pool process) to its open traces.
+
+    The histograms are not touched: the process that ran the stages observed them.
+    """
+    for trace_timings in getattr(_local, "traces", ()):
+        for name, seconds in timings.items():
+            trace_timings[name] = trace_timings.get(name, 0.0) + seconds
+
+
+def begin_trace():
+    """Start collecting {stage: seconds} on this thread; pass the dict to end_trace()"""
+    timings = {}
+    traces = getattr(_local, "traces", None)
+    if traces is None:
+        traces = _local.traces = []
+    traces.append(timings)
+    return timings
+
+
+def end_trace(timings):
+    traces = getattr(_local, "traces", [])
+    # By identity: two traces can hold equal dicts
+    for i in range(len(traces) - 1, -1, -1):
+        if traces[i] is timings:
+            del traces[i]
+            break
+    return timings
+
+
+@contextmanager
+def trace():
+    """Collect {stage: seconds} for the stages run on this thread inside the block (nestable)"""
+    timings = begin_trace()
+    try:
+        yield timings
+    finally:
+        end_trace(timings)
+
+
+def register_cache(cache_name, cache_info):
+    """Export hits/misses of a functools.lru_cache (or anything with a compatible cache_info())"""
+    def source():
+        info = cache_info()
+        return [
+            ("cache_hits_total", {"cache": cache_name}, info.hits),
+            ("cache_misses_total", {"cache": cache_name}, info.misses),
+        ]
+    _registry.add_source(source)
+
+
+def clear_dir():
+    """Drop snapshots of a previous server run (gunicorn on_starting)"""
+    if METRICS_DIR:
+        for path in glob.glob(os.path.join(METRICS_DIR, "metrics-*.json")):
+            os.remove(path)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # alive, owned by another user
+    return True
+
+
+def collect():
+    """Merged snapshot: this process, plus every live process that flushed to METRICS_DIR"""
+    if not METRICS_DIR:
+        snapshots = [_registry.snapshot()]
+    else:
+        _registry.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(METRICS_DIR, "metrics-*.json")):
+            pid = os.path.basename(path)[len("metrics-"):-len(".json")]
+            if pid.isdigit() and not _pid_alive(int(pid)):
+                # A worker gunicorn recycled or killed: its counts leave the sum
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # being replaced right now
+
+    histograms, counters = {}, {}
+    for snap in snapshots:
+        for name, labels, hist in snap["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [0] * len(hist))
+            histograms[key] = [a + b for a, b in zip(merged, hist)]
+        for name, labels, value in snap["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+    return {"processes": len(snapshots), "histograms": histograms, "counters": counters}
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+    merged = collect()
+    lines = []
+
+    def header(name, kind):
+        lines.append(f"# HELP {METRIC_PREFIX}{name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+
+    for name in sorted({name for name, _ in merged["histograms"]}):
+        header(name, "histogram")
+        for (hname, labels), hist in sorted(merged["histograms"].items()):
+            if hname != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), hist[:-1]):
+                cumulative += count
+                lines.append(f"{METRIC_PREFIX}{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{METRIC_PREFIX}{name}_sum{_format_labels(labels)} {hist[-1]}")
+            lines.append(f"{METRIC_PREFIX}{name}_count{_format_labels(labels)} {cumulative}")
+
+    for name in sorted({name for name, _ in merged["counters"]}):
+        header(name, "counter")
+        for (cname, labels), value in sorted(merged["counters"].items()):
+            if cname == name:
+                lines.append(f"{METRIC_PREFIX}{name}{_format_labels(labels)} {value}")
+
+    # Hit ratio per cache, for dashboards that don't want to do the division
+    caches = sorted({dict(labels)["cache"] for name, labels in merged["counters"] if name == "cache_hits_total"})
+    if caches:
+        header("cache_hit_ratio", "gauge")
+        for cache in caches:
+            key = (("cache", cache),)
+            hits = merged["counters"].get(("cache_hits_total", key), 0)
+            misses = merged["counters"].get(("cache_misses_total", key), 0)
+            ratio = hits / (hits + misses) if hits + misses else 0.0
+            lines.append(f'{METRIC_PREFIX}cache_hit_ratio{{cache="{cache}"}} {ratio}')
+
+    header("metrics_processes", "gauge")
+    lines.append(f"{METRIC_PREFIX}metrics_processes {merged['processes']}")
+    return "\n".join(lines) + "\n"
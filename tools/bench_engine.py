@@ -0,0 +1,212 @@
+"""Engine micro-benchmarks with JSON baselines and a regression check.
+
+Usage (from the repository root, next to checkpoints/):
+    python -m tools.bench_engine run --out benchmarks/baseline.json
+    python -m tools.bench_engine run --only search_content,detect_query_type --iterations 50
+    python -m tools.bench_engine run --compare benchmarks/baseline.json --threshold 0.15
+    python -m tools.bench_engine compare benchmarks/baseline.json benchmarks/new.json
+
+Each benchmark cycles through a fixed query set and reports p50/p95/p99/mean
+latency in ms and calls per second. `compare` (or `run --compare`) exits with
+status 1 when any benchmark's --metric (default p50) is slower than the
+baseline by more than --threshold (default 15%). Baselines are only
+comparable on the same machine.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+import process
+from process import (
+    combined_df, smart_search, detect_query_type, clean_text_spacy, filter_rows,
+    cached_vector_search, build_tfidf_index, DB_PATH,
+)
+
+# Fixed query sets, one per smart_search branch. detect_query_type never returns
+# "genre" for a plain genre name (genres are stored as JSON lists), so the genre
+# branch is timed through filter_rows, the code smart_search runs for it.
+QUERY_SETS = {
+    "genre": ["horror", "action", "drama", "animation", "thriller", "comedy", "romance", "sci-fi"],
+    "year": ["1994", "2010", "1999 drama", "classic 1980", "2019", "1972"],
+    "person": ["tom hanks", "leonardo dicaprio", "meryl streep", "quentin tarantino", "morgan freeman"],
+    "title": ["inception", "the matrix", "parasite", "interstellar", "gladiator"],
+    "content": ["space war robots", "love story in paris", "heist gone wrong", "haunted house family",
+                "time travel paradox", "zombie apocalypse survival"],
+}
+ALL_QUERIES = [q for queries in QUERY_SETS.values() for q in queries]
+PAGE_SIZE = 36
+
+
+def _quiet():
+    # smart_search prints the detected type on every call
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def _search_bench(query_type, cold_cache=False):
+    queries = QUERY_SETS[query_type]
+    for q in queries:
+        detected = detect_query_type(q, combined_df)
+        if detected != query_type:
+            print(f"  note: {q!r} is detected as {detected}, not {query_type}", file=sys.stderr)
+
+    def step(i):
+        if cold_cache:
+            cached_vector_search.cache_clear()
+        with _quiet():
+            smart_search(queries[i % len(queries)], top_n=1000)
+    return step
+
+
+def _genre_bench():
+    queries = QUERY_SETS["genre"]
+    return lambda i: filter_rows("genre", queries[i % len(queries)], combined_df)
+
+
+def _serialize_bench():
+    from app import clean_movie_data  # imports Flask; only when this benchmark runs
+    with _quiet():
+        pages = [smart_search(q, top_n=PAGE_SIZE) for q in ALL_QUERIES]
+    return lambda i: clean_movie_data(pages[i % len(pages)].materialize())
+
+
+def _index_build_bench():
+    conn = sqlite3.connect(DB_PATH)
+    weighted_text = [row[0] or "" for row in conn.execute("SELECT weighted_text FROM movies")]
+    conn.close()
+    return lambda i: build_tfidf_index(weighted_text)
+
+
+# name -> (setup returning step(i), default iterations)
+BENCHMARKS = {
+    "search_genre": (_genre_bench, 30),
+    "search_year": (lambda: _search_bench("year"), 100),
+    "search_person": (lambda: _search_bench("person"), 50),
+    "search_title": (lambda: _search_bench("title"), 50),
+    "search_content": (lambda: _search_bench("content", cold_cache=True), 50),
+    "search_content_cached": (lambda: _search_bench("content"), 50),
+    "detect_query_type": (lambda: lambda i: detect_query_type(ALL_QUERIES[i % len(ALL_QUERIES)], combined_df), 100),
+    "clean_text_spacy": (lambda: lambda i: clean_text_spacy(ALL_QUERIES[i % len(ALL_QUERIES)]), 500),
+    "clean_movie_data_page": (_serialize_bench, 200),
+    "index_build": (_index_build_bench, 3),
+}
+
+
+def run_benchmark(name, iterations=None, warmup=2):
+    setup, default_iterations = BENCHMARKS[name]
+    step = setup()
+    iterations = iterations or default_iterations
+    for i in range(warmup):
+        step(i)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter()
+        step(i)
+        latencies.append(time.perf_counter() - t)
+    wall = time.perf_counter() - started
+    ms = np.asarray(latencies) * 1000
+    return {
+        "iterations": iterations,
+        "p50": float(np.percentile(ms, 50)),
+        "p95": float(np.percentile(ms, 95)),
+        "p99": float(np.percentile(ms, 99)),
+        "mean": float(ms.mean()),
+        "throughput_per_s": iterations / wall,
+    }
+
+
+def run(names, iterations=None):
+    results = {}
+    print(f"{'benchmark':<24}{'iters':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>10}")
+    for name in names:
+        r = results[name] = run_benchmark(name, iterations)
+        print(f"{name:<24}{r['iterations']:>7}{r['p50']:>10.2f}{r['p95']:>10.2f}{r['p99']:>10.2f}"
+              f"{r['throughput_per_s']:>10.1f}")
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "catalog_rows": len(combined_df),
+        "tfidf_shape": list(process.tfidf_matrix.shape),
+        "benchmarks": results,
+    }
+
+
+def compare(baseline, current, metric="p50", threshold=0.15):
+    """Print the change per benchmark; return the names that regressed past threshold"""
+    regressions = []
+    print(f"{'benchmark':<24}{'baseline':>10}{'current':>10}{'change':>9}")
+    for name, result in current["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if base is None:
+            print(f"{name:<24}{'-':>10}{result[metric]:>10.2f}{'new':>9}")
+            continue
+        change = result[metric] / base[metric] - 1 if base[metric] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<24}{base[metric]:>10.2f}{result[metric]:>10.2f}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="run benchmarks")
+    run_parser.add_argument("--only", help="comma-separated benchmark names: " + ", ".join(BENCHMARKS))
+    run_parser.add_argument("--iterations", type=int, help="override every benchmark's iteration count")
+    run_parser.add_argument("--out", help="write results as JSON (e.g. a new baseline)")
+    run_parser.add_argument("--compare", help="baseline JSON to check against")
+
+    compare_parser = sub.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+
+    for p in (run_parser, compare_parser):
+        p.add_argument("--metric", default="p50", choices=["p50", "p95", "p99", "mean"])
+        p.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown, 0.15 = 15%%")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        names = args.only.split(",") if args.only else list(BENCHMARKS)
+        unknown = [n for n in names if n not in BENCHMARKS]
+        if unknown:
+            sys.exit(f"Unknown benchmark(s): {', '.join(unknown)}")
+        current = run(names, args.iterations)
+        if args.out:
+            if os.path.dirname(args.out):
+                os.makedirs(os.path.dirname(args.out), exist_ok=True)
+            with open(args.out, "w") as f:
+                json.dump(current, f, indent=2)
+        if not args.compare:
+            return
+        baseline = _load(args.compare)
+    else:
+        baseline, current = _load(args.baseline), _load(args.current)
+
+    print()
+    regressions = compare(baseline, current, args.metric, args.threshold)
+    if regressions:
+        sys.exit(f"\n{len(regressions)} benchmark(s) regressed more than {args.threshold:.0%} "
+                 f"on {args.metric}: {', '.join(regressions)}")
+    print(f"\nNo regression beyond {args.threshold:.0%} on {args.metric}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""HTTP load test: replay a weighted endpoint mix against a local server.
+
+Usage (from the repository root):
+    python -m tools.load_test                                   # Flask dev server, 1/4/16 clients
+    python -m tools.load_test --server gunicorn --workers 4 --concurrency 4,8,16,32 --duration 30
+    python -m tools.load_test --server none --url http://127.0.0.1:8000 --mix search=1,movie=1
+    python -m tools.load_test --out loadtest.json
+
+Starts app.py on a free port (unless --server none), logs in a local test user
+(registering it on first use) and runs closed-loop clients: each client sends
+its next request as soon as the previous one returns. Each concurrency level
+runs for --duration seconds and gets its own report: throughput, throughput
+per core, latency percentiles and error rate, both overall and per endpoint.
+"favorites" lists the test user's favorites; "favorite_add" upserts one, so
+it writes to checkpoints/movies.db.
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+import requests
+
+TEST_USER = {"username": "loadtest", "email": "loadtest@example.com", "password": "loadtest-password"}
+SEARCH_QUERIES = [
+    "inception", "the matrix", "tom hanks", "leonardo dicaprio", "1994", "classic 1980",
+    "space war robots", "love story in paris", "heist gone wrong", "haunted house family",
+    "time travel paradox", "zombie apocalypse survival", "horror", "comedy", "batman",
+]
+GENRES = ["Action", "Comedy", "Drama", "Horror", "Romance", "Sci-Fi", "Thriller", "Animation"]
+DEFAULT_MIX = "search=40,movie=25,genres=5,genre=15,favorites=10,favorite_add=5"
+GUNICORN_CONF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn.conf.py")
+
+
+class Client:
+    """One simulated user: its own cookie session, logged in as the test user"""
+
+    def __init__(self, base_url, movie_ids, seed):
+        self.base_url = base_url
+        self.movie_ids = movie_ids
+        self.random = random.Random(seed)
+        self.session = requests.Session()
+        login(self.session, base_url)
+
+    def request(self, op):
+        if op == "search":
+            query = self.random.choice(SEARCH_QUERIES)
+            return self.session.get(f"{self.base_url}/api/search",
+                                    params={"query": query, "fields": "card"})
+        if op == "movie":
+            return self.session.get(f"{self.base_url}/api/movie/{self.random.choice(self.movie_ids)}")
+        if op == "genres":
+            return self.session.get(f"{self.base_url}/api/genres", params={"fields": "card"})
+        if op == "genre":
+            return self.session.get(f"{self.base_url}/api/movies/genre/{self.random.choice(GENRES)}",
+                                    params={"fields": "card"})
+        if op == "favorites":
+            return self.session.get(f"{self.base_url}/api/favorites", params={"fields": "card", "limit": 20})
+        if op == "favorite_add":
+            return self.session.post(f"{self.base_url}/api/favorites/{self.random.choice(self.movie_ids)}",
+                                     json={"status": "watch_later"})
+        raise ValueError(f"Unknown operation: {op}")
+
+
+def login(session, base_url):
+    response = session.post(f"{base_url}/api/auth/login",
+                            json={"username": TEST_USER["username"], "password": TEST_USER["password"]})
+    if response.status_code == 401:
+        response = session.post(f"{base_url}/api/auth/register", json=TEST_USER)
+    if not response.ok:
+        raise RuntimeError(f"Cannot log in the test user: {response.status_code} {response.text[:200]}")
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("search", "movie", "genres", "genre", "favorites", "favorite_add"):
+            raise ValueError(f"Unknown endpoint in --mix: {name!r}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+# =====================================
+# Server process
+# =====================================
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind, port, workers, threads):
+    env = dict(os.environ)
+    if kind == "gunicorn":
+        env.update(BIND=f"127.0.0.1:{port}", WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads))
+        cmd = [sys.executable, "-m", "gunicorn", "-c", GUNICORN_CONF, "app:app"]
+    else:
+        # app.py's own __main__ runs with the reloader and debugger on; neither belongs in a load test
+        cmd = [sys.executable, "-m", "flask", "--app", "app", "run",
+               "--host", "127.0.0.1", "--port", str(port), "--no-reload", "--no-debugger", "--with-threads"]
+    # Not a pipe: nobody drains it during the run, and the dev server logs every request
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen(cmd, env=env, stdout=log, stderr=subprocess.STDOUT)
+    process.log = log
+    return process
+
+
+def wait_ready(base_url, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            process.log.seek(0)
+            raise RuntimeError("Server exited during startup:\n" + process.log.read().decode(errors="replace")[-2000:])
+        try:
+            if requests.get(f"{base_url}/api/auth/me", timeout=2).status_code < 500:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server not ready after {timeout}s")
+
+
+def stop_server(process):
+    if process is None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    process.log.close()
+
+
+def sample_movie_ids(base_url, count=200):
+    ids = []
+    for query in SEARCH_QUERIES:
+        data = requests.get(f"{base_url}/api/search",
+                            params={"query": query, "fields": "id", "per_page": 36}).json().get("data", [])
+        ids.extend(m["id"] for m in data)
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise RuntimeError("No movie ids returned by /api/search")
+    return ids[:count]
+
+
+# =====================================
+# Load levels
+# =====================================
+
+def run_level(base_url, movie_ids, mix, concurrency, duration, seed):
+    ops, weights = list(mix), list(mix.values())
+    results = defaultdict(list)  # op -> [(latency seconds, ok)]
+    lock = threading.Lock()
+    clients = [Client(base_url, movie_ids, seed + i) for i in range(concurrency)]
+    start_line = threading.Barrier(concurrency + 1)
+    stop_at = [0.0]
+
+    def loop(client):
+        local = defaultdict(list)
+        start_line.wait()
+        while time.monotonic() < stop_at[0]:
+            op = client.random.choices(ops, weights)[0]
+            t = time.perf_counter()
+            try:
+                ok = client.request(op).status_code < 400
+            except requests.RequestException:
+                ok = False
+            local[op].append((time.perf_counter() - t, ok))
+        with lock:
+            for op, samples in local.items():
+                results[op].extend(samples)
+
+    threads = [threading.Thread(target=loop, args=(c,), daemon=True) for c in clients]
+    for t in threads:
+        t.start()
+    stop_at[0] = time.monotonic() + duration
+    started = time.perf_counter()
+    start_line.wait()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    for c in clients:
+        c.session.close()
+    return summarize(results, wall)
+
+
+def _stats(samples, wall):
+    latencies = np.array([s[0] for s in samples]) * 1000
+    errors = sum(1 for s in samples if not s[1])
+    return {
+        "requests": len(samples),
+        "throughput_per_s": len(samples) / wall,
+        "error_rate": errors / len(samples),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "max_ms": float(latencies.max()),
+    }
+
+
+def summarize(results, wall):
+    everything = [s for samples in results.values() for s in samples]
+    if not everything:
+        return {"wall_seconds": wall, "requests": 0, "endpoints": {}}
+    return dict(_stats(everything, wall), wall_seconds=wall,
+                endpoints={op: _stats(samples, wall) for op, samples in sorted(results.items())})
+
+
+def print_level(concurrency, report, cores):
+    print(f"\nconcurrency {concurrency}: {report['requests']} requests in {report['wall_seconds']:.1f}s, "
+          f"{report['throughput_per_s']:.1f} req/s ({report['throughput_per_s'] / cores:.1f} per core), "
+          f"errors {report['error_rate']:.2%}")
+    print(f"  {'endpoint':<14}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for op, s in report["endpoints"].items():
+        print(f"  {op:<14}{s['requests']:>9}{s['throughput_per_s']:>9.1f}{s['p50_ms']:>9.1f}"
+              f"{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['error_rate']:>8.1%}")
+    print(f"  {'all':<14}{report['requests']:>9}{report['throughput_per_s']:>9.1f}{report['p50_ms']:>9.1f}"
+          f"{report['p95_ms']:>9.1f}{report['p99_ms']:>9.1f}{report['error_rate']:>8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", choices=["flask", "gunicorn", "none"], default="flask",
+                        help="server to start; 'none' targets --url")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="base URL with --server none")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=1, help="gunicorn threads per worker")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated client counts, one level each")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per level")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds of load before the first level")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint weights, default: " + DEFAULT_MIX)
+    parser.add_argument("--cores", type=int, help="cores serving the load, for req/s per core "
+                        "(default: gunicorn workers, else 1 for flask, else this machine's CPUs)")
+    parser.add_argument("--startup-timeout", type=float, default=180)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the report as JSON")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    levels = [int(c) for c in args.concurrency.split(",")]
+    cores = args.cores or {"gunicorn": args.workers, "flask": 1}.get(args.server, os.cpu_count())
+
+    process = None
+    if args.server == "none":
+        base_url = args.url.rstrip("/")
+    else:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        print(f"Starting {args.server} on {base_url} ...")
+        process = start_server(args.server, port, args.workers, args.threads)
+    try:
+        wait_ready(base_url, process, args.startup_timeout)
+        movie_ids = sample_movie_ids(base_url)
+        if args.warmup > 0:
+            run_level(base_url, movie_ids, mix, max(levels), args.warmup, args.seed)
+        report = {
+            "server": args.server, "workers": args.workers if args.server == "gunicorn" else None,
+            "cores": cores, "mix": mix, "duration": args.duration, "levels": {},
+        }
+        for concurrency in levels:
+            level = report["levels"][concurrency] = run_level(
+                base_url, movie_ids, mix, concurrency, args.duration, args.seed + concurrency * 1000
+            )
+            if level["requests"]:
+                print_level(concurrency, level, cores)
+    finally:
+        stop_server(process)
+
+    best = max(report["levels"].items(), key=lambda kv: kv[1].get("throughput_per_s", 0))
+    print(f"\nPeak: {best[1].get('throughput_per_s', 0):.1f} req/s at concurrency {best[0]} "
+          f"({best[1].get('throughput_per_s', 0) / cores:.1f} per core)")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Report per-worker USS/PSS of a running gunicorn master to confirm memory stays shared.
+
+Usage:
+    python -m tools.measure_workers --pid <master pid>
+    python -m tools.measure_workers --pidfile gunicorn.pid --warmup-url http://127.0.0.1:8000/api/search?query=space --warmup-requests 200
+
+USS is what each worker owns privately (what killing it would free); PSS splits
+shared pages evenly across the processes mapping them. With the preload mode in
+gunicorn.conf.py, worker USS should stay small next to the master's RSS, and grow
+only slowly under traffic.
+"""
+
+import argparse
+import sys
+import urllib.request
+
+from memstats import process_memory, child_pids
+
+
+def _mb(value):
+    return "-" if value is None else f"{value / 2**20:9.1f}"
+
+
+def warm_up(url, requests):
+    for _ in range(requests):
+        try:
+            with urllib.request.urlopen(url, timeout=30) as resp:
+                resp.read()
+        except OSError as e:
+            print(f"warm-up request failed: {e}", file=sys.stderr)
+            return
+
+
+def report(master_pid):
+    workers = child_pids(master_pid)
+    if not workers:
+        sys.exit(f"No worker processes found under pid {master_pid}")
+
+    rows = [("master", master_pid, process_memory(master_pid))]
+    rows += [("worker", pid, process_memory(pid)) for pid in workers]
+
+    print(f"{'role':<8}{'pid':>8}{'RSS MB':>11}{'PSS MB':>11}{'USS MB':>11}{'shared MB':>11}")
+    for role, pid, mem in rows:
+        print(f"{role:<8}{pid:>8}  {_mb(mem['rss'])}  {_mb(mem['pss'])}  {_mb(mem['uss'])}  {_mb(mem['shared'])}")
+
+    worker_mem = [mem for role, _, mem in rows if role == "worker"]
+    if worker_mem[0]["pss"] is None:
+        print("\nPSS/USS need /proc/<pid>/smaps_rollup (Linux); only RSS was available.")
+        return
+
+    total_pss = sum(mem["pss"] for _, _, mem in rows)
+    total_rss = sum(mem["rss"] for _, _, mem in rows)
+    avg_uss = sum(mem["uss"] for mem in worker_mem) / len(worker_mem)
+    print(f"\nworkers: {len(worker_mem)}")
+    print(f"sum RSS (as if nothing were shared): {total_rss / 2**20:.1f} MB")
+    print(f"sum PSS (actual footprint):          {total_pss / 2**20:.1f} MB")
+    print(f"mean worker USS:                     {avg_uss / 2**20:.1f} MB")
+    print(f"shared fraction of worker RSS:       "
+          f"{1 - sum(m['uss'] for m in worker_mem) / sum(m['rss'] for m in worker_mem):.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--pid", type=int, help="gunicorn master pid")
+    group.add_argument("--pidfile", help="gunicorn pidfile (gunicorn -p)")
+    parser.add_argument("--warmup-url", help="URL to hit before measuring, to dirty pages as real traffic would")
+    parser.add_argument("--warmup-requests", type=int, default=100)
+    args = parser.parse_args()
+
+    pid = args.pid
+    if args.pidfile:
+        with open(args.pidfile) as f:
+            pid = int(f.read().strip())
+
+    if args.warmup_url:
+        warm_up(args.warmup_url, args.warmup_requests)
+    report(pid)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Summarize the slow-query log: which stages and which queries cost the most.
+
+Usage:
+    python -m tools.slow_queries                          # every process's SLOW_QUERY_LOG and its rotated backups
+    python -m tools.slow_queries logs/slow_queries-*.jsonl* --top 20
+    python -m tools.slow_queries --endpoint /api/search --stage detect_query_type
+
+Each log line is one request slower than SLOW_QUERY_MS, with its per-stage
+timings (see slowlog.py). A stage "dominates" a request when it is that
+request's largest stage. Stages can nest (vector_search contains vectorize
+and score on a cache miss), so shares may add up to more than 100%.
+
+Searches also log the engine that served them. Pool searches carry the pool
+process's own stages plus search_pool, the round trip including the queue.
+Sharded searches time detection, cleaning and vectorizing on the coordinator,
+and shard_filter / shard_score for the scatter-gather. Micro-batched content
+scoring shows up as batched_score, the wait for the batch.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from slowlog import SLOW_QUERY_LOG
+
+
+def read_entries(paths):
+    entries = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue  # a line cut short by a crash
+    return entries
+
+
+def _pct(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def summarize(entries, top):
+    durations = [e["duration_ms"] for e in entries]
+    print(f"{len(entries)} slow requests, "
+          f"p50 {_pct(durations, 50):.0f} ms, p95 {_pct(durations, 95):.0f} ms, max {max(durations):.0f} ms")
+
+    by_endpoint = Counter(e["endpoint"] for e in entries)
+    print("\nBy endpoint:")
+    for endpoint, count in by_endpoint.most_common():
+        print(f"  {endpoint:<28}{count:>7}")
+
+    by_engine = Counter(e["engine"] for e in entries if e.get("engine"))
+    if by_engine:
+        print("\nBy search engine:")
+        for engine, count in by_engine.most_common():
+            print(f"  {engine:<28}{count:>7}")
+
+    stage_ms = defaultdict(list)
+    dominant = Counter()
+    for e in entries:
+        stages = e.get("stages_ms") or {}
+        for name, ms in stages.items():
+            stage_ms[name].append(ms)
+        if stages:
+            dominant[max(stages, key=stages.get)] += 1
+    total_ms = sum(durations)
+    print("\nBy stage:")
+    print(f"  {'stage':<22}{'requests':>9}{'total ms':>12}{'share':>8}{'mean':>9}{'p95':>9}{'dominant':>10}")
+    for name, values in sorted(stage_ms.items(), key=lambda kv: -sum(kv[1])):
+        print(f"  {name:<22}{len(values):>9}{sum(values):>12.0f}{sum(values) / total_ms:>8.0%}"
+              f"{np.mean(values):>9.1f}{_pct(values, 95):>9.1f}{dominant[name]:>10}")
+
+    by_query = defaultdict(list)
+    for e in entries:
+        by_query[(e["endpoint"], e.get("query") or e.get("movie_id") or "")].append(e)
+    print(f"\nTop {top} offenders by total time:")
+    print(f"  {'total ms':>9}{'count':>7}{'max ms':>9}  {'type':<9}{'top stage':<20}query")
+    ranked = sorted(by_query.items(), key=lambda kv: -sum(e["duration_ms"] for e in kv[1]))
+    for (endpoint, key), group in ranked[:top]:
+        stages = Counter()
+        for e in group:
+            stages.update(e.get("stages_ms") or {})
+        top_stage = stages.most_common(1)[0][0] if stages else "-"
+        print(f"  {sum(e['duration_ms'] for e in group):>9.0f}{len(group):>7}"
+              f"{max(e['duration_ms'] for e in group):>9.0f}  {str(group[0].get('query_type') or '-'):<9}"
+              f"{top_stage:<20}{endpoint} {key}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", help="log files (default: SLOW_QUERY_LOG and its backups)")
+    parser.add_argument("--top", type=int, default=10, help="number of queries to list")
+    parser.add_argument("--endpoint", help="only this endpoint, e.g. /api/search")
+    parser.add_argument("--stage", help="only requests where this stage dominates")
+    args = parser.parse_args()
+
+    paths = args.paths
+    if not paths:
+        base = SLOW_QUERY_LOG.replace("{pid}", "*")
+        paths = sorted(glob.glob(base) + glob.glob(base + ".*"))
+    paths = [p for p in paths if os.path.isfile(p)]
+    if not paths:
+        sys.exit("No slow-query log files found")
+
+    entries = read_entries(paths)
+    if args.endpoint:
+        entries = [e for e in entries if e["endpoint"] == args.endpoint]
+    if args.stage:
+        entries = [e for e in entries
+                   if e.get("stages_ms") and max(e["stages_ms"], key=e["stages_ms"].get) == args.stage]
+    if not entries:
+        sys.exit("No matching entries")
+    summarize(entries, args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""Synthetic movie catalogs for scaling benchmarks, sampled from the bundled corpus.
+
+Usage (from the repository root):
+    python -m tools.synth_catalog generate --scale 10 --out-dir synthetic/x10
+    python -m tools.synth_catalog bench --scales 1,10,30 --out scaling.json
+    python -m tools.synth_catalog bench --scales 100 --novelty 0.8
+
+`generate` writes movies_out_synth_*.csv files with the crawler's columns and
+quoting, so a generated directory can stand in for MovieData/ in a full build.
+Each synthetic movie starts from a real one. Its genre, tag and keyword lists,
+year, country and ratings come from that movie, with the ratings jittered. Each
+word of its title and plot, and each name in its cast, director and writer
+lists, is then swapped with probability --novelty for one drawn from the
+corpus-wide frequency distribution. Topical co-occurrence and the Zipf-shaped
+term frequencies both survive. The vocabulary is bounded by the corpus, so
+growth shows up in rows and non-zeros rather than in new terms.
+
+`bench` builds the catalog for each scale in memory. It runs the build
+pipeline (prepare_index_text, then build_tfidf_index) and reports clean and fit
+time, matrix and vocabulary size, RSS, and content-query latency (vectorize,
+score, top-k) on the resulting index. Scale 1 is the bundled corpus itself.
+"""
+
+import argparse
+import csv
+import gc
+import glob
+import json
+import os
+import resource
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+SOURCE_DIR = "MovieData"
+PEOPLE_COLUMNS = ("cast", "director", "writer")
+CHUNK_ROWS = 50_000
+
+
+def load_corpus(source_dir=SOURCE_DIR):
+    files = sorted(glob.glob(os.path.join(source_dir, "movies_out_*.csv")))
+    files = [f for f in files if "synth" not in os.path.basename(f)]
+    if not files:
+        sys.exit(f"No movies_out_*.csv files in {source_dir}")
+    return pd.concat([pd.read_csv(f) for f in files], ignore_index=True)
+
+
+def _json_list(value):
+    try:
+        items = json.loads(value)
+    except (TypeError, ValueError):
+        return []
+    return items if isinstance(items, list) else []
+
+
+class Vocabulary:
+    """Corpus-wide frequency distribution of tokens; draws in bulk"""
+
+    def __init__(self, token_lists):
+        counts = Counter(token for tokens in token_lists for token in tokens)
+        self.tokens = np.array(list(counts), dtype=object)
+        weights = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        self.p = weights / weights.sum()
+
+    def draw(self, rng, n):
+        return self.tokens[rng.choice(len(self.tokens), size=n, p=self.p)] if n else self.tokens[:0]
+
+
+class CorpusModel:
+    """Per-row templates from the real catalog plus the vocabularies to mutate them with"""
+
+    def __init__(self, corpus):
+        self.columns = list(corpus.columns)
+        self.corpus = corpus.reset_index(drop=True)
+        self.plots = [str(p).split() if isinstance(p, str) else [] for p in corpus["plot"]]
+        self.titles = [str(t).split() if isinstance(t, str) else [] for t in corpus["title"]]
+        self.people = {c: [_json_list(v) for v in corpus[c]] for c in PEOPLE_COLUMNS if c in corpus.columns}
+        self.plot_vocab = Vocabulary(self.plots)
+        self.title_vocab = Vocabulary(self.titles)
+        self.people_vocab = Vocabulary([names for lists in self.people.values() for names in lists])
+
+    def generate(self, rows, rng, novelty=0.5, id_offset=0):
+        """DataFrame of `rows` synthetic movies in the crawler's column order"""
+        base = rng.integers(0, len(self.corpus), size=rows)
+        df = self.corpus.iloc[base].reset_index(drop=True).copy()
+        df["id"] = [f"sy{id_offset + i:08d}" for i in range(rows)]
+
+        df["title"] = self._mutate([self.titles[b] for b in base], self.title_vocab, rng, novelty, " ")
+        if "original_title" in df.columns:
+            df["original_title"] = df["title"]
+        df["plot"] = self._mutate([self.plots[b] for b in base], self.plot_vocab, rng, novelty, " ")
+        for column, lists in self.people.items():
+            df[column] = self._mutate([lists[b] for b in base], self.people_vocab, rng, novelty, None)
+
+        if "rating" in df.columns:
+            df["rating"] = (df["rating"] + rng.normal(0, 0.3, rows)).clip(1, 10).round(1)
+        for column in ("vote_count", "popularity"):
+            if column in df.columns:
+                jittered = df[column] * rng.lognormal(0, 0.5, rows)
+                df[column] = jittered.round().astype("Int64") if column == "vote_count" else jittered.round(3)
+        return df[self.columns]
+
+    @staticmethod
+    def _mutate(token_lists, vocab, rng, novelty, sep):
+        """Swap each token for a corpus draw with probability `novelty`; join with sep, or as a JSON list"""
+        lengths = np.fromiter((len(t) for t in token_lists), dtype=np.int64, count=len(token_lists))
+        swap = rng.random(lengths.sum()) < novelty
+        replacements = iter(vocab.draw(rng, int(swap.sum())))
+        out, pos = [], 0
+        for tokens, n in zip(token_lists, lengths):
+            picked = [next(replacements) if s else t for t, s in zip(tokens, swap[pos:pos + n])]
+            pos += n
+            out.append(" ".join(picked) if sep is not None else json.dumps(picked, ensure_ascii=False))
+        return out
+
+
+def generate(model, rows, out_dir, rng, novelty, chunk_rows=CHUNK_ROWS):
+    os.makedirs(out_dir, exist_ok=True)
+    for part, start in enumerate(range(0, rows, chunk_rows), 1):
+        df = model.generate(min(chunk_rows, rows - start), rng, novelty, id_offset=start)
+        path = os.path.join(out_dir, f"movies_out_synth_{part:04d}.csv")
+        # The crawler quotes every string column and leaves numbers bare
+        df.to_csv(path, index=False, quoting=csv.QUOTE_NONNUMERIC)
+        print(f"  {path}: {len(df)} rows")
+
+
+# =====================================
+# Scaling benchmark
+# =====================================
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def bench_scale(df, queries, top_k=10, repeats=5):
+    from process import prepare_index_text, build_tfidf_index, clean_text_spacy, sparse_bytes, container_bytes
+    from memstats import process_memory
+    from sklearn.metrics.pairwise import linear_kernel
+
+    rss_before = process_memory()["rss"]
+    t = time.perf_counter()
+    prepare_index_text(df)
+    clean_seconds = time.perf_counter() - t
+    t = time.perf_counter()
+    vectorizer, matrix = build_tfidf_index(df["weighted_text"])
+    fit_seconds = time.perf_counter() - t
+    rss_after = process_memory()["rss"]
+
+    latencies = []
+    for _ in range(repeats):
+        for query in queries:
+            t = time.perf_counter()
+            similarity = linear_kernel(vectorizer.transform([clean_text_spacy(query)]), matrix).ravel()
+            top = np.argpartition(-similarity, top_k)[:top_k]
+            top = top[np.argsort(-similarity[top], kind="stable")]
+            latencies.append(time.perf_counter() - t)
+    ms = np.asarray(latencies) * 1000
+
+    return {
+        "rows": len(df),
+        "clean_seconds": round(clean_seconds, 3),
+        "fit_seconds": round(fit_seconds, 3),
+        "terms": len(vectorizer.vocabulary_),
+        "nnz": int(matrix.nnz),
+        "matrix_mb": round(sparse_bytes(matrix) / 2**20, 1),
+        "vocabulary_mb": round(container_bytes(vectorizer.vocabulary_) / 2**20, 1),
+        "rss_growth_mb": round((rss_after - rss_before) / 2**20, 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "query_p50_ms": float(np.percentile(ms, 50)),
+        "query_p95_ms": float(np.percentile(ms, 95)),
+        "query_p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+def bench(model, scales, rng, novelty):
+    from tools.bench_engine import QUERY_SETS  # imports the engine; only the benchmark needs it
+    queries = QUERY_SETS["content"] + QUERY_SETS["title"]
+
+    print(f"{'scale':>6}{'rows':>10}{'clean s':>9}{'fit s':>8}{'terms':>9}{'matrix MB':>11}"
+          f"{'RSS +MB':>9}{'peak MB':>9}{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}")
+    results = {}
+    for scale in scales:
+        if scale == 1:
+            df = model.corpus.copy()
+        else:
+            df = model.generate(int(len(model.corpus) * scale), rng, novelty)
+        r = results[scale] = bench_scale(df, queries)
+        print(f"{scale:>6g}{r['rows']:>10}{r['clean_seconds']:>9.1f}{r['fit_seconds']:>8.1f}{r['terms']:>9}"
+              f"{r['matrix_mb']:>11.1f}{r['rss_growth_mb']:>9.1f}{r['peak_rss_mb']:>9.1f}"
+              f"{r['query_p50_ms']:>8.1f}{r['query_p95_ms']:>8.1f}{r['query_p99_ms']:>8.1f}")
+        del df
+        gc.collect()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", default=SOURCE_DIR, help="directory with the crawler's movies_out_*.csv")
+    parser.add_argument("--novelty", type=float, default=0.5,
+                        help="probability of swapping each title/plot word and person name (0-1)")
+    parser.add_argument("--seed", type=int, default=0)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen_parser = sub.add_parser("generate", help="write a synthetic catalog as CSV")
+    gen_parser.add_argument("--scale", type=float, default=10, help="catalog size as a multiple of the corpus")
+    gen_parser.add_argument("--out-dir", required=True)
+    gen_parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows per CSV file")
+
+    bench_parser = sub.add_parser("bench", help="build the index at each scale and measure it")
+    bench_parser.add_argument("--scales", default="1,10", help="comma-separated multiples; 1 = bundled corpus")
+    bench_parser.add_argument("--out", help="write the results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    corpus = load_corpus(args.source)
+    model = CorpusModel(corpus)
+    print(f"Corpus: {len(corpus)} movies, {len(model.plot_vocab.tokens)} plot tokens, "
+          f"{len(model.people_vocab.tokens)} people")
+
+    if args.command == "generate":
+        rows = int(len(corpus) * args.scale)
+        print(f"Generating {rows} movies into {args.out_dir}")
+        generate(model, rows, args.out_dir, rng, args.novelty, args.chunk_rows)
+        return
+
+    results = bench(model, [float(s) for s in args.scales.split(",")], rng, args.novelty)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"novelty": args.novelty, "seed": args.seed, "scales": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()